@@ -4,10 +4,47 @@
 为 connection_tester.py 添加详细的过程日志
 """
 
+import atexit
 import logging
+import logging.handlers
+import queue
 import sys
 from datetime import datetime
 
+# 模块级缓存的 logger，避免每次记录都经过 logging.getLogger 的全局锁和字典查找
+_LOGGER = logging.getLogger('aurora_failover')
+
+# 操作类型与连接状态对应的图标
+_OPERATION_EMOJI = {
+    'read': '🔍',
+    'write': '✏️',
+    'transaction': '🔄'
+}
+
+_STATUS_EMOJI = {
+    'connected': '🟢',
+    'disconnected': '🔴',
+    'reconnecting': '🟡',
+    'failed': '❌'
+}
+
+class _BatchFileHandler(logging.StreamHandler):
+    """写入文件缓冲后不逐条 flush，由 flush() 在每批记录写完后统一刷新"""
+    
+    def emit(self, record):
+        try:
+            self.stream.write(self.format(record) + self.terminator)
+        except Exception:
+            self.handleError(record)
+
+class _BatchMemoryHandler(logging.handlers.MemoryHandler):
+    """每批记录转发给目标处理器后只刷新一次"""
+    
+    def flush(self):
+        super().flush()
+        if self.target is not None:
+            self.target.flush()
+
 # 配置日志格式
 logging.basicConfig(
     level=logging.INFO,
@@ -16,16 +53,26 @@ logging.basicConfig(
 )
 
 def setup_enhanced_logging():
-    """设置增强的日志功能"""
-    logger = logging.getLogger('aurora_failover')
+    """
+    设置增强的日志功能
+    
+    日志记录经 QueueHandler 放入队列，由 QueueListener 后台线程写入控制台和文件，
+    调用日志的测试线程不再执行同步 I/O。
+    
+    Returns:
+        (logger, listener)，测试结束时需调用 listener.stop() 刷新剩余日志
+    """
+    logger = _LOGGER
     
     # 创建控制台处理器
     console_handler = logging.StreamHandler(sys.stdout)
     console_handler.setLevel(logging.INFO)
     
-    # 创建文件处理器
+    # 创建文件处理器（64KB 缓冲，避免每条日志一次 write 系统调用）
     timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-    file_handler = logging.FileHandler(f'results/test_log_{timestamp}.log')
+    log_file = open(f'results/test_log_{timestamp}.log', 'a',
+                    buffering=64 * 1024, encoding='utf-8')
+    file_handler = _BatchFileHandler(log_file)
     file_handler.setLevel(logging.DEBUG)
     
     # 设置格式
@@ -37,69 +84,91 @@ def setup_enhanced_logging():
     console_handler.setFormatter(formatter)
     file_handler.setFormatter(formatter)
     
-    logger.addHandler(console_handler)
-    logger.addHandler(file_handler)
+    # 文件输出通过 MemoryHandler 批量写入，WARNING 及以上级别立即刷新
+    memory_handler = _BatchMemoryHandler(
+        capacity=500,
+        flushLevel=logging.WARNING,
+        target=file_handler
+    )
+    memory_handler.setLevel(logging.DEBUG)
+    
+    def _close_log_file():
+        memory_handler.flush()
+        log_file.close()
+    
+    atexit.register(_close_log_file)
+    
+    # 测试线程只负责入队，实际写入由监听线程完成；
+    # 不再向 root logger 传播，避免 basicConfig 的处理器在调用线程同步重复输出
+    log_queue = queue.Queue(-1)
+    logger.addHandler(logging.handlers.QueueHandler(log_queue))
+    logger.propagate = False
+    
+    listener = logging.handlers.QueueListener(
+        log_queue, console_handler, memory_handler,
+        respect_handler_level=True
+    )
+    listener.start()
     
-    return logger
+    return logger, listener
 
 def log_operation_start(connection_type, operation_type, operation_id, details=""):
     """记录操作开始"""
-    logger = logging.getLogger('aurora_failover')
-    emoji_map = {
-        'read': '🔍',
-        'write': '✏️',
-        'transaction': '🔄'
-    }
-    emoji = emoji_map.get(operation_type, '🔧')
-    logger.info(f"[{connection_type}] {emoji} 开始{operation_type}操作 {operation_id} {details}")
+    logger = _LOGGER
+    # 每个操作都会调用，级别被过滤时直接返回，省去格式化开销
+    if not logger.isEnabledFor(logging.INFO):
+        return
+    emoji = _OPERATION_EMOJI.get(operation_type, '🔧')
+    logger.info("[%s] %s 开始%s操作 %s %s",
+                connection_type, emoji, operation_type, operation_id, details)
 
 def log_operation_success(connection_type, operation_type, operation_id, response_time, affected_rows=0):
     """记录操作成功"""
-    logger = logging.getLogger('aurora_failover')
-    logger.info(f"[{connection_type}] ✅ {operation_type}操作 {operation_id} 成功，"
-               f"响应时间: {response_time:.3f}s，影响行数: {affected_rows}")
+    logger = _LOGGER
+    if not logger.isEnabledFor(logging.INFO):
+        return
+    logger.info("[%s] ✅ %s操作 %s 成功，响应时间: %.3fs，影响行数: %d",
+                connection_type, operation_type, operation_id, response_time, affected_rows)
 
 def log_operation_failure(connection_type, operation_type, operation_id, error_message):
     """记录操作失败"""
-    logger = logging.getLogger('aurora_failover')
-    logger.error(f"[{connection_type}] ❌ {operation_type}操作 {operation_id} 失败: {error_message}")
+    logger = _LOGGER
+    logger.error("[%s] ❌ %s操作 %s 失败: %s",
+                 connection_type, operation_type, operation_id, error_message)
 
 def log_connection_status(connection_type, status, details=""):
     """记录连接状态"""
-    logger = logging.getLogger('aurora_failover')
-    status_emoji = {
-        'connected': '🟢',
-        'disconnected': '🔴',
-        'reconnecting': '🟡',
-        'failed': '❌'
-    }
-    emoji = status_emoji.get(status, '⚪')
-    logger.info(f"[{connection_type}] {emoji} 连接状态: {status} {details}")
+    logger = _LOGGER
+    emoji = _STATUS_EMOJI.get(status, '⚪')
+    logger.info("[%s] %s 连接状态: %s %s", connection_type, emoji, status, details)
 
 def log_downtime_event(connection_type, event_type, duration=None):
     """记录停机事件"""
-    logger = logging.getLogger('aurora_failover')
+    logger = _LOGGER
     if event_type == 'start':
-        logger.warning(f"[{connection_type}] 🚨 检测到连接中断，开始记录停机时间")
+        logger.warning("[%s] 🚨 检测到连接中断，开始记录停机时间", connection_type)
     elif event_type == 'end':
-        logger.info(f"[{connection_type}] ✅ 连接恢复，停机时长: {duration:.3f}秒")
+        logger.info("[%s] ✅ 连接恢复，停机时长: %.3f秒", connection_type, duration)
 
 def log_test_progress(connection_type, total_ops, success_rate, current_tps=None):
     """记录测试进度"""
-    logger = logging.getLogger('aurora_failover')
-    message = f"[{connection_type}] 📊 已执行 {total_ops} 个操作，成功率: {success_rate:.1f}%"
+    logger = _LOGGER
     if current_tps:
-        message += f"，当前TPS: {current_tps:.1f}"
-    logger.info(message)
+        logger.info("[%s] 📊 已执行 %d 个操作，成功率: %.1f%%，当前TPS: %.1f",
+                    connection_type, total_ops, success_rate, current_tps)
+    else:
+        logger.info("[%s] 📊 已执行 %d 个操作，成功率: %.1f%%",
+                    connection_type, total_ops, success_rate)
 
 def log_pgbench_status(connection_type, tps, latency_ms, errors=0):
     """记录 pgbench 状态"""
-    logger = logging.getLogger('aurora_failover')
-    logger.info(f"[{connection_type}] 📈 pgbench - TPS: {tps:.1f}, 延迟: {latency_ms:.2f}ms, 错误: {errors}")
+    logger = _LOGGER
+    logger.info("[%s] 📈 pgbench - TPS: %.1f, 延迟: %.2fms, 错误: %d",
+                connection_type, tps, latency_ms, errors)
 
 if __name__ == "__main__":
     # 测试日志功能
-    logger = setup_enhanced_logging()
+    logger, listener = setup_enhanced_logging()
     
     # 模拟一些日志输出
     log_connection_status('direct', 'connected', '初始连接成功')
@@ -110,4 +179,5 @@ if __name__ == "__main__":
     log_test_progress('direct', 1250, 97.2, 156.7)
     log_pgbench_status('proxy', 1234.5, 8.12, 2)
     
+    listener.stop()
     print("✅ 增强日志功能测试完成")
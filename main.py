@@ -6,6 +6,7 @@ Aurora PostgreSQL 故障转移测试主程序
 import argparse
 import sys
 import os
+from concurrent.futures import ThreadPoolExecutor, wait
 from src.connection_tester import ConnectionTester
 from src.config import TestConfig
 from src.reporter import Reporter
@@ -15,6 +16,11 @@ from src.failover_tester import FailoverTester
 # 导入增强日志功能
 from enhanced_logging import setup_enhanced_logging, log_connection_status, log_test_progress
 
+CONNECTION_LABELS = {
+    'direct': '直接连接',
+    'proxy': '代理连接'
+}
+
 
 def parse_arguments():
     """解析命令行参数"""
@@ -29,6 +35,8 @@ def parse_arguments():
                        help='查询间隔（秒）')
     parser.add_argument('--verbose', '-v', action='store_true',
                        help='启用详细日志输出')
+    parser.add_argument('--pretty-json', action='store_true',
+                       help='结果 JSON 文件按缩进格式输出 (默认: 紧凑格式)')
     
     # 业务场景测试参数
     parser.add_argument('--concurrent-workers', type=int, default=3,
@@ -39,6 +47,12 @@ def parse_arguments():
                        help='写操作权重百分比 (默认: 20)')
     parser.add_argument('--transaction-weight', type=int, default=10,
                        help='事务操作权重百分比 (默认: 10)')
+    parser.add_argument('--target-rate', type=float, default=None,
+                       help='目标操作速率，次/秒 (默认: 不设置，按 0.1-0.5 秒随机间隔提交)')
+    parser.add_argument('--write-batch-size', type=int, default=1,
+                       help='批量写入行数，大于 1 时写操作按连接攒批执行 (默认: 1，不攒批)')
+    parser.add_argument('--read-from-reader', action='store_true',
+                       help='读操作发往读端点 (默认: 所有操作发往写端点)')
     
     # pgbench 负载测试参数
     parser.add_argument('--enable-pgbench', action='store_true',
@@ -64,10 +78,25 @@ def main():
     os.makedirs('results', exist_ok=True)
     
     # 设置增强日志
+    log_listener = None
     if args.verbose:
-        logger = setup_enhanced_logging()
+        logger, log_listener = setup_enhanced_logging()
         print("🔧 已启用详细日志输出")
     
+    try:
+        run_tests(args)
+    finally:
+        # 停止日志监听线程，确保队列中剩余的日志全部写出
+        if log_listener:
+            log_listener.stop()
+    
+    print("\n✅ 测试完成！")
+    if args.verbose:
+        print("📄 详细日志已保存到 results/test_log_*.log")
+
+
+def run_tests(args):
+    """根据命令行参数运行测试"""
     print("Aurora PostgreSQL 故障转移测试工具")
     print("=" * 50)
     
@@ -108,6 +137,7 @@ def main():
         
         # 设置 pgbench 连接配置
         config.pgbench_config.connections = config.get_database_connections_for_pgbench()
+        config.pgbench_config.connection_options = config.get_connection_options()
         
         # 使用故障转移测试器
         tester = FailoverTester(config)
@@ -129,50 +159,65 @@ def main():
             concurrent_workers=args.concurrent_workers,
             read_weight=args.read_weight,
             write_weight=args.write_weight,
-            transaction_weight=args.transaction_weight
+            transaction_weight=args.transaction_weight,
+            target_rate=args.target_rate,
+            write_batch_size=args.write_batch_size,
+            read_from_reader=args.read_from_reader
         )
         
-        if args.mode in ['direct', 'both']:
-            print("\n开始直接连接测试...")
-            if args.verbose:
-                log_connection_status('direct', 'connecting', '开始直接连接测试')
-            
-            direct_tester = ConnectionTester(config, 'direct')
-            direct_result = direct_tester.run_test(args.duration, args.concurrent_workers)
-            
-            # 生成报告
-            reporter = Reporter()
-            reporter.save_result('direct', direct_result)
-            print(f"直接连接测试完成，结果已保存")
-            
-            if args.verbose:
-                log_test_progress('direct', direct_result.total_attempts, direct_result.success_rate)
+        connection_types = ['direct', 'proxy'] if args.mode == 'both' else [args.mode]
         
-        if args.mode in ['proxy', 'both']:
-            print("\n开始代理连接测试...")
-            if args.verbose:
-                log_connection_status('proxy', 'connecting', '开始代理连接测试')
-            
-            proxy_tester = ConnectionTester(config, 'proxy')
-            proxy_result = proxy_tester.run_test(args.duration, args.concurrent_workers)
-            
-            # 生成报告
-            reporter = Reporter()
-            reporter.save_result('proxy', proxy_result)
-            print(f"代理连接测试完成，结果已保存")
+        if len(connection_types) > 1:
+            # 直接连接和代理连接同时运行，保证两者观测到的是同一次故障转移
+            print("\n同时开始直接连接和代理连接测试...")
+            testers = {
+                connection_type: create_connection_tester(config, connection_type, args)
+                for connection_type in connection_types
+            }
+            with ThreadPoolExecutor(max_workers=len(connection_types)) as executor:
+                futures = {
+                    connection_type: executor.submit(tester.run_test, args.duration, args.concurrent_workers)
+                    for connection_type, tester in testers.items()
+                }
+                try:
+                    wait(futures.values())
+                except KeyboardInterrupt:
+                    # Ctrl-C 只会送达主线程，需要通知各测试线程停止，再收集已完成的部分结果
+                    print("\n⚠️ 测试被用户中断，正在停止并保存已完成的结果...")
+                    while not all(future.done() for future in futures.values()):
+                        for tester in testers.values():
+                            tester.is_running = False
+                        wait(futures.values(), timeout=0.5)
+                results = {
+                    connection_type: future.result()
+                    for connection_type, future in futures.items()
+                }
+        else:
+            tester = create_connection_tester(config, args.mode, args)
+            results = {args.mode: tester.run_test(args.duration, args.concurrent_workers)}
+        
+        # 生成报告
+        reporter = Reporter()
+        for connection_type, result in results.items():
+            reporter.save_result(connection_type, result, pretty=args.pretty_json)
+            print(f"{CONNECTION_LABELS[connection_type]}测试完成，结果已保存")
             
             if args.verbose:
-                log_test_progress('proxy', proxy_result.total_attempts, proxy_result.success_rate)
+                log_test_progress(connection_type, result.total_attempts, result.success_rate)
         
         if args.mode == 'both':
             print("\n生成对比报告...")
             reporter.generate_comparison_report()
-    
-    print("\n✅ 测试完成！")
-    if args.verbose:
-        print("📄 详细日志已保存到 results/test_log_*.log")
 
 
+def create_connection_tester(config, connection_type, args):
+    """创建单个连接类型的业务场景测试器"""
+    print(f"\n开始{CONNECTION_LABELS[connection_type]}测试...")
+    if args.verbose:
+        log_connection_status(connection_type, 'connecting', f'开始{CONNECTION_LABELS[connection_type]}测试')
+    
+    return ConnectionTester(config, connection_type)
+
 if __name__ == "__main__":
     try:
         main()
@@ -3,6 +3,7 @@
 """
 
 from dataclasses import dataclass
+from functools import cached_property
 from typing import Dict
 
 
@@ -15,8 +16,9 @@ class DatabaseConfig:
     username: str = "postgres"
     password: str = "Guoguo123"
     
-    def get_connection_string(self) -> str:
-        """获取连接字符串"""
+    @cached_property
+    def connection_string(self) -> str:
+        """连接字符串（首次访问时生成并缓存）"""
         return f"postgresql://{self.username}:{self.password}@{self.host}:{self.port}/{self.database}"
 
 
@@ -24,7 +26,8 @@ class TestConfig:
     """测试配置类"""
     
     def __init__(self, duration=300, interval=0.1, mode='both', pgbench_config=None, 
-                 concurrent_workers=3, read_weight=70, write_weight=20, transaction_weight=10):
+                 concurrent_workers=3, read_weight=70, write_weight=20, transaction_weight=10,
+                 target_rate=None, write_batch_size=1, read_from_reader=False):
         # Aurora 直接连接配置
         self.direct_writer = DatabaseConfig(
             host="ards-with-rdsproxy.cluster-czfhjvjvmivm.ap-southeast-1.rds.amazonaws.com"
@@ -58,15 +61,56 @@ class TestConfig:
         # 操作间隔配置
         self.min_operation_interval = 0.1  # 最小操作间隔
         self.max_operation_interval = 0.5  # 最大操作间隔
+        self.target_rate = target_rate     # 目标操作速率（次/秒），设置后取代随机间隔
         
-        # 连接池配置
-        self.connection_pool_size = 5
+        # 读操作是否发往读端点；默认关闭，所有操作都发往写端点，停机时间反映写实例的可用性
+        self.read_from_reader = read_from_reader
+        
+        # 连接管理配置：每个工作线程独占一个连接（开启 read_from_reader 时每个端点各一个）
+        self.pool_recycle = 30  # 连接空闲超过该秒数后，使用前先做健康检查
+        
+        # 批量写入配置：大于 1 时订单、日志写入和登录更新在每个连接上攒批后一次性执行。
+        # 攒批期间的写操作不访问数据库，会掩盖停机，测量故障转移时应保持为 1
+        self.write_batch_size = write_batch_size
+        self.write_batch_max_delay = 0.05  # 缓冲区中最早的一行等待超过该秒数时，下次写入即刷新
+        
+        # 日志配置
+        self.success_log_stride = 50  # 每 N 个成功操作输出一条汇总日志
+        
+        # downtime 监控线程绑定的 CPU 编号（仅 Linux），默认 None 表示不绑定；
+        # 与 pgbench 同机运行、监控线程被抢占导致 downtime 抖动时，可设置为一个空闲 CPU
+        self.monitor_cpu = None
         
         # 连接参数
         self.connection_timeout = 5  # 连接超时时间（秒）
         self.query_timeout = 3       # 查询超时时间（秒）
         self.retry_attempts = 3      # 重试次数
         self.retry_delay = 0.5       # 重试间隔（秒）
+        
+        # TLS 配置：默认 prefer 与 libpq 默认值一致（服务端支持时使用 TLS）；
+        # 设置根证书后可将 ssl_mode 改为 verify-full。业务测试、验证连接和 downtime 监控连接共用这些参数
+        self.ssl_mode = 'prefer'
+        self.ssl_root_cert = None    # 例如 '/etc/ssl/certs/rds-global-bundle.pem'
+        
+        # TCP keepalive 配置：由操作系统尽早发现失效连接，而不是等待查询超时
+        self.keepalives_idle = 10      # 空闲多久后开始探测（秒）
+        self.keepalives_interval = 3   # 探测间隔（秒）
+        self.keepalives_count = 2      # 探测失败多少次判定连接断开
+        self.tcp_user_timeout = 5000   # 未确认数据的最长等待时间（毫秒）
+    
+    def get_connection_options(self) -> Dict:
+        """获取 psycopg2.connect 使用的 TLS 与 keepalive 参数"""
+        options = {
+            'sslmode': self.ssl_mode,
+            'keepalives': 1,
+            'keepalives_idle': self.keepalives_idle,
+            'keepalives_interval': self.keepalives_interval,
+            'keepalives_count': self.keepalives_count,
+            'tcp_user_timeout': self.tcp_user_timeout
+        }
+        if self.ssl_root_cert:
+            options['sslrootcert'] = self.ssl_root_cert
+        return options
     
     def get_config(self, connection_type: str, endpoint_type: str = 'writer') -> DatabaseConfig:
         """
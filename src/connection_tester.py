@@ -3,32 +3,242 @@
 """
 
 import time
+import io
 import psycopg2
+from psycopg2.extras import execute_batch, execute_values
 import threading
 import random
-import uuid
+import bisect
+import math
+import itertools
+from array import array
 from datetime import datetime, timezone
-from typing import List, Dict, Optional
+from typing import ClassVar, List, Dict, Optional, Set, Tuple
 from dataclasses import dataclass, field
-from concurrent.futures import ThreadPoolExecutor, as_completed
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
 
-from .config import TestConfig
+from .config import DatabaseConfig, TestConfig
 
 
-@dataclass
+# 操作类型，列式记录中按下标存储
+OPERATION_TYPES = ('read', 'write', 'transaction')
+OPERATION_TYPE_IDS = {operation_type: i for i, operation_type in enumerate(OPERATION_TYPES)}
+
+# 连续失败达到该次数认为进入停机
+DOWNTIME_FAILURE_THRESHOLD = 3
+
+# 响应时间分布的桶上界（秒），按对数间隔划分，超过最后一个上界的计入溢出桶
+LATENCY_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 30, 60)
+
+# 业务读写语句，由 psycopg2 在客户端填入参数后作为普通查询发送（不使用服务端 PREPARE）
+BUSINESS_SQL = {
+    'user_list': """
+        SELECT id, username, email, last_login, login_count, status
+        FROM business_users 
+        WHERE status = 'active'
+        ORDER BY last_login DESC NULLS LAST
+        LIMIT 20
+    """,
+    'order_summary': """
+        SELECT status, COUNT(*) as count, SUM(amount) as total_amount
+        FROM business_orders 
+        WHERE created_at >= CURRENT_DATE - INTERVAL '7 days'
+        GROUP BY status
+    """,
+    'product_search': """
+        SELECT id, name, price, stock, category
+        FROM business_products 
+        WHERE category = %s AND stock > 0
+        ORDER BY price
+        LIMIT 10
+    """,
+    'user_orders': """
+        SELECT o.id, o.order_number, o.amount, o.status, o.created_at
+        FROM business_orders o
+        JOIN business_users u ON o.user_id = u.id
+        WHERE u.id = %s
+        ORDER BY o.created_at DESC
+        LIMIT 10
+    """,
+    'recent_logs': """
+        SELECT l.action, l.details, l.created_at, u.username
+        FROM business_logs l
+        LEFT JOIN business_users u ON l.user_id = u.id
+        WHERE l.created_at >= CURRENT_TIMESTAMP - INTERVAL '1 hour'
+        ORDER BY l.created_at DESC
+        LIMIT 50
+    """,
+    'update_user_login': """
+        UPDATE business_users 
+        SET last_login = CURRENT_TIMESTAMP,
+            login_count = login_count + 1
+        WHERE id = %s
+    """,
+    'create_order': """
+        INSERT INTO business_orders (user_id, order_number, amount, status)
+        VALUES (%s, %s, %s, 'pending')
+    """,
+    'update_product_stock': """
+        UPDATE business_products 
+        SET stock = GREATEST(0, stock + %s)
+        WHERE id = %s
+    """,
+    'insert_log': """
+        INSERT INTO business_logs (user_id, action, details, ip_address)
+        VALUES (%s, %s, %s, %s)
+    """
+}
+
+# 购买事务：扣减库存、创建订单、记录日志在一条语句内完成，作为普通参数化查询发送。
+# 库存不足或产品不存在时 UPDATE 不返回行，后续插入随之为空，语句返回 0 行
+PURCHASE_SQL = """
+    WITH p AS (
+        UPDATE business_products
+        SET stock = stock - %(quantity)s
+        WHERE id = %(product_id)s AND stock >= %(quantity)s
+        RETURNING price
+    ), o AS (
+        INSERT INTO business_orders (user_id, order_number, amount, status)
+        SELECT %(user_id)s, %(order_number)s, p.price * %(quantity)s, 'confirmed' FROM p
+        RETURNING id
+    )
+    INSERT INTO business_logs (user_id, action, details)
+    SELECT %(user_id)s, 'purchase', %(details)s || o.id FROM o
+    RETURNING id
+"""
+
+READ_STATEMENTS = ('user_list', 'order_summary', 'product_search', 'user_orders', 'recent_logs')
+WRITE_STATEMENTS = ('update_user_login', 'create_order', 'update_product_stock', 'insert_log')
+PRODUCT_CATEGORIES = ('Electronics', 'Books', 'Clothing', 'Home')
+
+# 批量写入使用的 SQL，按缓冲区名称索引
+BATCH_INSERT_SQL = {
+    'orders': "INSERT INTO business_orders (user_id, order_number, amount, status) "
+              "VALUES %s ON CONFLICT (order_number) DO NOTHING",
+    'logs': "INSERT INTO business_logs (user_id, action, details, ip_address) VALUES %s"
+}
+
+# 无法合并为一条 INSERT 的批量写入，通过 execute_batch 将多条语句合并为一次往返
+BATCH_EXECUTE_SQL = {
+    'logins': BUSINESS_SQL['update_user_login']
+}
+
+
+class TesterConnection(psycopg2.extensions.connection):
+    """测试器使用的连接，附带可复用的健康检查游标和批量写入缓冲区"""
+    probe_cursor = None
+    endpoint_type = 'writer'  # 连接指向的端点：'writer' 或 'reader'
+    last_used_at = 0.0  # 最近一次使用完毕的时间（time.monotonic）
+    
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.write_buffers = {}  # 缓冲区名称 -> 待写入的行
+        self.write_buffered_at = {}  # 缓冲区名称 -> 最早一行进入缓冲区的时间（time.monotonic）
+        self.uncommitted_write_rows = 0  # 当前事务中已写入、尚未提交且已计为成功的缓冲行数
+
+
+class RandomSource:
+    """工作线程独享的随机数源，常用的用户/产品 ID 按批预生成"""
+    
+    BATCH_SIZE = 4096
+    USER_IDS = range(1, 101)
+    PRODUCT_IDS = range(1, 51)
+    
+    def __init__(self):
+        self.rng = random.Random()
+        self._user_ids = []
+        self._product_ids = []
+    
+    def user_id(self) -> int:
+        """随机用户 ID（1-100）"""
+        if not self._user_ids:
+            self._user_ids = self.rng.choices(self.USER_IDS, k=self.BATCH_SIZE)
+        return self._user_ids.pop()
+    
+    def product_id(self) -> int:
+        """随机产品 ID（1-50）"""
+        if not self._product_ids:
+            self._product_ids = self.rng.choices(self.PRODUCT_IDS, k=self.BATCH_SIZE)
+        return self._product_ids.pop()
+
+
+def _make_connect(db_config: DatabaseConfig, config: TestConfig, read_only: bool = False):
+    """
+    生成绑定了连接参数的连接函数，避免每次连接都重新读取配置属性
+    
+    read_only=True 时通过启动参数将会话默认设为只读，建立连接后无需再发送 SET 语句
+    """
+    connect_kwargs = dict(
+        host=db_config.host,
+        port=db_config.port,
+        database=db_config.database,
+        user=db_config.username,
+        password=db_config.password,
+        connection_factory=TesterConnection,
+        connect_timeout=config.connection_timeout,
+        **config.get_connection_options()
+    )
+    if read_only:
+        connect_kwargs['options'] = '-c default_transaction_read_only=on'
+    connect = psycopg2.connect
+    
+    def _connect() -> TesterConnection:
+        return connect(**connect_kwargs)
+    
+    return _connect
+
+
+@dataclass(slots=True)
 class BusinessOperation:
     """业务操作记录"""
-    operation_id: str
+    operation_id: int
     operation_type: str  # 'read', 'write', 'transaction'
-    start_time: datetime
-    end_time: Optional[datetime] = None
+    start_ts: float  # Unix 时间戳（秒）
+    end_ts: Optional[float] = None
     success: bool = False
     error_message: str = ""
     response_time: Optional[float] = None
     affected_rows: int = 0
+    
+    @property
+    def start_time(self) -> datetime:
+        """操作开始时间（按需构造 datetime）"""
+        return datetime.fromtimestamp(self.start_ts, timezone.utc)
+    
+    @property
+    def end_time(self) -> Optional[datetime]:
+        """操作结束时间（按需构造 datetime）"""
+        if self.end_ts is None:
+            return None
+        return datetime.fromtimestamp(self.end_ts, timezone.utc)
 
 
-@dataclass
+@dataclass(slots=True)
+class LatencyStats:
+    """响应时间统计（只保留聚合值，内存占用固定）"""
+    count: int = 0
+    total: float = 0.0
+    min: float = float('inf')
+    max: float = 0.0
+    
+    def record(self, value: float):
+        """记录一次响应时间"""
+        self.count += 1
+        self.total += value
+        if value < self.min:
+            self.min = value
+        if value > self.max:
+            self.max = value
+    
+    @property
+    def mean(self) -> float:
+        """平均响应时间"""
+        if self.count == 0:
+            return 0.0
+        return self.total / self.count
+
+
+@dataclass(slots=True)
 class TestResult:
     """测试结果"""
     connection_type: str
@@ -42,7 +252,15 @@ class TestResult:
     downtime_periods: List[Dict] = field(default_factory=list)
     
     # 新增业务统计字段
-    operations: List[BusinessOperation] = field(default_factory=list)
+    # 全部操作的列式记录：每个操作只占各数组中的一个元素（约 26 字节），
+    # 不再保留 BusinessOperation 对象；错误信息见 critical_operations
+    op_ids: array = field(default_factory=lambda: array('q'))
+    op_types: array = field(default_factory=lambda: array('b'))  # OPERATION_TYPES 下标
+    op_starts: array = field(default_factory=lambda: array('d'))  # Unix 时间戳
+    op_response_times: array = field(default_factory=lambda: array('d'))  # 无响应时间时为 NaN
+    op_success: array = field(default_factory=lambda: array('b'))
+    # 失败操作及故障后的首个成功操作，停机检测依赖这些记录，完整保留
+    critical_operations: List[BusinessOperation] = field(default_factory=list)
     read_operations: int = 0
     write_operations: int = 0
     transaction_operations: int = 0
@@ -50,10 +268,57 @@ class TestResult:
     successful_writes: int = 0
     successful_transactions: int = 0
     
+    # 连接失败后（停机期间）发起的重连尝试次数
+    reconnect_attempts: int = 0
+    # 批量写入时已计为成功、但最终未能写入数据库的缓冲行数
+    lost_write_rows: int = 0
+    
+    # 成功操作的响应时间统计（总体及按操作类型）
+    latency: LatencyStats = field(default_factory=LatencyStats)
+    latency_by_type: Dict[str, LatencyStats] = field(default_factory=lambda: {
+        'read': LatencyStats(),
+        'write': LatencyStats(),
+        'transaction': LatencyStats()
+    })
+    # 各响应时间桶内的操作数，最后一个元素为溢出桶
+    bucket_counts: List[int] = field(default_factory=lambda: [0] * (len(LATENCY_BUCKETS) + 1))
+    _last_failed: bool = field(default=False, repr=False)
+    _downtime_total: float = field(default=0.0, repr=False)
+    
+    def add_operation(self, operation: BusinessOperation):
+        """记录一个已完成的操作"""
+        self.op_ids.append(operation.operation_id)
+        self.op_types.append(OPERATION_TYPE_IDS[operation.operation_type])
+        self.op_starts.append(operation.start_ts)
+        self.op_response_times.append(
+            operation.response_time if operation.response_time is not None else math.nan)
+        self.op_success.append(operation.success)
+        if not operation.success:
+            self.critical_operations.append(operation)
+            self._last_failed = True
+            return
+        if self._last_failed:
+            # 故障后的首个成功操作标志着恢复
+            self.critical_operations.append(operation)
+            self._last_failed = False
+        if operation.response_time:
+            self.latency.record(operation.response_time)
+            self.latency_by_type[operation.operation_type].record(operation.response_time)
+            self.bucket_counts[bisect.bisect_left(LATENCY_BUCKETS, operation.response_time)] += 1
+    
+    def add_downtime_period(self, start: datetime, end: datetime, duration: float):
+        """记录一个停机区间，同时累加总停机时间"""
+        self.downtime_periods.append({
+            'start': start,
+            'end': end,
+            'duration': duration
+        })
+        self._downtime_total += duration
+    
     @property
     def total_downtime(self) -> float:
-        """计算总停机时间（秒）"""
-        return sum(period['duration'] for period in self.downtime_periods)
+        """总停机时间（秒）"""
+        return self._downtime_total
     
     @property
     def success_rate(self) -> float:
@@ -83,98 +348,250 @@ class TestResult:
             return 0.0
         return (self.successful_transactions / self.transaction_operations) * 100
     
+    def percentile(self, p: float) -> float:
+        """
+        响应时间百分位数（秒），返回所在桶的上界
+        
+        Args:
+            p: 百分位，0-100
+        """
+        total = sum(self.bucket_counts)
+        if total == 0:
+            return 0.0
+        threshold = total * p / 100
+        cumulative = 0
+        for upper, count in zip(LATENCY_BUCKETS, self.bucket_counts):
+            cumulative += count
+            if cumulative >= threshold:
+                return upper
+        return self.latency.max
+    
     @property
     def average_response_time(self) -> float:
         """平均响应时间"""
-        successful_ops = [op for op in self.operations if op.success and op.response_time]
-        if not successful_ops:
-            return 0.0
-        return sum(op.response_time for op in successful_ops) / len(successful_ops)
+        return self.latency.mean
 
 
 class ConnectionTester:
     """连接测试器 - 业务场景测试"""
     
+    # 已完成建表和初始化数据的数据库 (host, port, database)。直接连接和代理连接测试
+    # 可能并行运行，建表需要串行执行，且同一进程内每个数据库只需执行一次
+    _initialized_databases: ClassVar[Set[Tuple[str, int, str]]] = set()
+    _setup_lock: ClassVar[threading.Lock] = threading.Lock()
+    
     def __init__(self, config: TestConfig, connection_type: str):
         self.config = config
         self.connection_type = connection_type
         self.db_config = config.get_config(connection_type, 'writer')
+        # 默认所有操作都发往写端点，停机检测只反映写实例的可用性；
+        # 开启 read_from_reader 后读操作改发读端点（未配置时回退到写端点）。
+        # 读端点在写实例故障转移期间通常仍可用，读操作的成功会重置连续失败计数而掩盖写端点停机
+        self.reader_db_config = config.get_config(connection_type, 'reader') or self.db_config
+        self.read_endpoint = 'reader' if getattr(config, 'read_from_reader', False) else 'writer'
+        self._endpoint_configs = {'writer': self.db_config, 'reader': self.reader_db_config}
+        self._connects = {
+            endpoint_type: _make_connect(db_config, config, read_only=endpoint_type == 'reader')
+            for endpoint_type, db_config in self._endpoint_configs.items()
+        }
+        self._op_counter = itertools.count(1)  # 操作编号，next() 在 CPython 中是线程安全的
         self.is_running = False
         
-        # 连接池管理
-        self.connection_pool = []
-        self.pool_size = getattr(config, 'connection_pool_size', 5)
-        self.lock = threading.Lock()
+        # 连接管理：每个工作线程独占一个连接，整个测试期间复用；
+        # 所有创建过的连接登记在 _connections 中，测试结束时统一关闭
+        self._local = threading.local()
+        self._connections = set()
+        self.lock = threading.Lock()  # 保护连接登记表和重连退避状态
+        self.pool_recycle = getattr(config, 'pool_recycle', 30)
+        
+        # 重连退避：新建连接失败后按 0.05s 起翻倍的间隔再尝试，避免停机期间每个操作
+        # 都立即发起一次注定失败的连接；上限为操作提交间隔（见 _reconnect_delay_max），
+        # 保证恢复后最多晚一个操作间隔即可被发现
+        self._reconnect_delay = 0.0
+        self._next_reconnect_at = 0.0
+        self.reconnect_attempts = 0
+        
+        # 批量写入：大于 1 时订单和日志写入按批合并
+        self.write_batch_size = getattr(config, 'write_batch_size', 1)
+        self.write_batch_max_delay = getattr(config, 'write_batch_max_delay', 0.05)
+        self.lost_write_rows = 0  # 写入失败或随连接丢弃的缓冲行数，受 lock 保护
         
         # 业务场景配置
         self.read_weight = getattr(config, 'read_weight', 70)
         self.write_weight = getattr(config, 'write_weight', 20)
         self.transaction_weight = getattr(config, 'transaction_weight', 10)
         
+        # 操作处理方法及其累计权重（权重总和不为 100 时按比例生效）
+        self._operation_handlers = (
+            self._execute_read_operation,
+            self._execute_write_operation,
+            self._execute_transaction_operation
+        )
+        self._operation_cum_weights = tuple(itertools.accumulate(
+            (self.read_weight, self.write_weight, self.transaction_weight)
+        ))
+        
         # 操作间隔配置
         self.min_interval = getattr(config, 'min_operation_interval', 0.1)
         self.max_interval = getattr(config, 'max_operation_interval', 0.5)
+        # 目标操作速率（次/秒）；设置后按固定速率提交，取代上面的随机间隔
+        self.target_rate = getattr(config, 'target_rate', None)
+        self._reconnect_delay_max = 1 / self.target_rate if self.target_rate else self.min_interval
+        
+        # 成功操作日志按批次汇总输出
+        self.success_log_stride = getattr(config, 'success_log_stride', 50)
+        self._success_bucket_rt_sum = 0.0
+        self._success_bucket_count = 0
+        
+        # 在线停机检测状态
+        self._consec_failures = 0
+        self._last_failure_ts = 0.0
+        self._downtime_start: Optional[float] = None
+        
+        # 墙上时钟基准：操作时间戳由 perf_counter 偏移推算，热路径不再构造 datetime
+        self._wall_base = time.time()
+        self._perf_base = time.perf_counter()
+        
+    def _now_ts(self) -> float:
+        """返回当前 Unix 时间戳"""
+        return self._wall_base + (time.perf_counter() - self._perf_base)
+    
+    def _create_connection(self, endpoint_type: str = 'writer') -> psycopg2.extensions.connection:
+        """
+        创建数据库连接
         
-    def _create_connection(self) -> psycopg2.extensions.connection:
-        """创建数据库连接"""
+        Args:
+            endpoint_type: 'writer' 或 'reader'
+        """
         try:
-            conn = psycopg2.connect(
-                host=self.db_config.host,
-                port=self.db_config.port,
-                database=self.db_config.database,
-                user=self.db_config.username,
-                password=self.db_config.password,
-                connect_timeout=self.config.connection_timeout
-            )
-            conn.autocommit = False  # 业务场景需要事务控制
+            conn = self._connects[endpoint_type]()
+            conn.endpoint_type = endpoint_type
+            # 写操作和事务需要事务控制；读连接只执行单条只读查询，自动提交省去每次的 BEGIN/COMMIT，
+            # _run_operation 中的 commit()/rollback() 在自动提交模式下不会访问服务端。
+            # autocommit 只改变客户端行为，不向服务端发送 SET 语句
+            conn.autocommit = endpoint_type == 'reader'
+            # 健康检查游标随连接创建并复用；探测使用普通 SELECT 1，
+            # 服务端 PREPARE 会让 RDS 代理把会话固定在同一个后端连接上
+            conn.probe_cursor = conn.cursor()
+            conn.last_used_at = time.monotonic()
             return conn
         except Exception as e:
             raise ConnectionError(f"无法创建数据库连接: {e}")
     
-    def _initialize_connection_pool(self):
-        """初始化连接池"""
-        print(f"[{self.connection_type}] 初始化连接池...")
-        self.connection_pool = []
-        for i in range(self.pool_size):
-            try:
-                conn = self._create_connection()
-                self.connection_pool.append(conn)
-            except Exception as e:
-                print(f"[{self.connection_type}] 创建连接 {i+1} 失败: {e}")
-    
-    def _get_connection(self) -> Optional[psycopg2.extensions.connection]:
-        """从连接池获取连接"""
+    def _initialize_connections(self):
+        """重置连接状态，各工作线程在首次操作时创建自己的连接"""
+        print(f"[{self.connection_type}] 初始化连接...")
+        self._local = threading.local()
         with self.lock:
-            for i, conn in enumerate(self.connection_pool):
-                if conn and not conn.closed:
-                    try:
-                        # 测试连接是否可用
-                        with conn.cursor() as cursor:
-                            cursor.execute("SELECT 1")
-                        return conn
-                    except:
-                        # 连接不可用，尝试重新创建
-                        try:
-                            conn.close()
-                        except:
-                            pass
-                        try:
-                            new_conn = self._create_connection()
-                            self.connection_pool[i] = new_conn
-                            return new_conn
-                        except:
-                            self.connection_pool[i] = None
-            
-            # 如果没有可用连接，尝试创建新连接
+            self._connections = set()
+    
+    def _get_connection(self, endpoint_type: str = 'writer') -> Optional[psycopg2.extensions.connection]:
+        """获取当前线程指向指定端点的连接，用完后必须通过 _release_connection 归还"""
+        conn = getattr(self._local, endpoint_type, None)
+        if conn is not None and not conn.closed:
+            # 只有空闲超过 pool_recycle 秒的连接才在使用前检查，
+            # 其余失效连接由 _run_operation 在执行阶段发现并重试
+            if time.monotonic() - conn.last_used_at <= self.pool_recycle:
+                return conn
             try:
-                return self._create_connection()
+                # 测试连接是否可用
+                conn.probe_cursor.execute("SELECT 1")
+                return conn
             except:
-                return None
+                pass
+        
+        if conn is not None:
+            self._discard_connection(conn)
+        
+        conn = self._new_connection(endpoint_type)
+        if conn is not None:
+            setattr(self._local, endpoint_type, conn)
+            with self.lock:
+                self._connections.add(conn)
+        return conn
+    
+    def _new_connection(self, endpoint_type: str = 'writer') -> Optional[psycopg2.extensions.connection]:
+        """按重连退避节奏创建新连接，失败时返回 None"""
+        with self.lock:
+            wait = self._next_reconnect_at - time.monotonic()
+            if self._reconnect_delay:
+                self.reconnect_attempts += 1
+        if wait > 0:
+            time.sleep(wait)
+        
+        try:
+            conn = self._create_connection(endpoint_type)
+        except:
+            with self.lock:
+                self._reconnect_delay = min(self._reconnect_delay * 2 if self._reconnect_delay else 0.05,
+                                            self._reconnect_delay_max)
+                self._next_reconnect_at = time.monotonic() + self._reconnect_delay
+            return None
+        
+        with self.lock:
+            self._reconnect_delay = 0.0
+            self._next_reconnect_at = 0.0
+        return conn
+    
+    def _release_connection(self, conn: psycopg2.extensions.connection, close: bool = False):
+        """归还当前线程的连接；close=True 时关闭该连接，下次操作重新创建"""
+        if close or conn.closed:
+            self._discard_connection(conn)
+        else:
+            conn.last_used_at = time.monotonic()
+    
+    def _discard_connection(self, conn: psycopg2.extensions.connection):
+        """关闭连接并从当前线程和登记表中移除，关闭前尽量写入其缓冲区中的行"""
+        self._drain_write_buffers(conn)
+        if getattr(self._local, conn.endpoint_type, None) is conn:
+            setattr(self._local, conn.endpoint_type, None)
+        with self.lock:
+            self._connections.discard(conn)
+        try:
+            conn.close()
+        except:
+            pass
+    
+    def _rollback(self, conn: psycopg2.extensions.connection) -> bool:
+        """回滚当前事务，返回连接是否仍然可以复用"""
+        try:
+            conn.rollback()
+            return True
+        except:
+            return False
+    
+    def _close_connections(self):
+        """关闭所有线程创建的连接"""
+        with self.lock:
+            connections, self._connections = self._connections, set()
+        for conn in connections:
+            self._drain_write_buffers(conn)
+            if not conn.closed:
+                try:
+                    conn.probe_cursor.close()
+                except:
+                    pass
+                try:
+                    conn.close()
+                except:
+                    pass
     
     def _setup_test_tables(self):
-        """创建测试表"""
-        conn = self._get_connection()
-        if not conn:
+        """创建测试表（每个数据库只执行一次）"""
+        key = (self.db_config.host, self.db_config.port, self.db_config.database)
+        with ConnectionTester._setup_lock:
+            if key in ConnectionTester._initialized_databases:
+                print(f"[{self.connection_type}] 测试表已初始化，跳过创建")
+                return
+            self._create_test_tables()
+            ConnectionTester._initialized_databases.add(key)
+    
+    def _create_test_tables(self):
+        """创建测试表并导入初始数据"""
+        # 建表使用一个单独的短连接，不占用工作线程的连接
+        try:
+            conn = self._create_connection()
+        except Exception:
             raise Exception("无法获取数据库连接来创建测试表")
         
         try:
@@ -229,342 +646,332 @@ class ConnectionTester:
                     )
                 """)
                 
-                # 插入一些初始数据
+                # 插入一些初始数据：表为空时通过 COPY 批量导入，与建表在同一事务中提交。
+                # 产品表没有唯一约束，只在为空时导入，避免每次运行重复插入
                 cursor.execute("""
-                    INSERT INTO business_users (username, email) 
-                    SELECT 'user_' || generate_series(1, 100), 
-                           'user_' || generate_series(1, 100) || '@example.com'
-                    ON CONFLICT (username) DO NOTHING
+                    SELECT EXISTS (SELECT 1 FROM business_users),
+                           EXISTS (SELECT 1 FROM business_products)
                 """)
+                has_users, has_products = cursor.fetchone()
                 
-                cursor.execute("""
-                    INSERT INTO business_products (name, price, stock, category)
-                    SELECT 'Product ' || generate_series(1, 50),
-                           (random() * 1000)::decimal(10,2),
-                           (random() * 100)::integer,
-                           CASE (random() * 4)::integer 
-                               WHEN 0 THEN 'Electronics'
-                               WHEN 1 THEN 'Books'
-                               WHEN 2 THEN 'Clothing'
-                               ELSE 'Home'
-                           END
-                    ON CONFLICT DO NOTHING
-                """)
+                if not has_users:
+                    users = io.StringIO(''.join(
+                        f"user_{i}\tuser_{i}@example.com\n" for i in range(1, 101)
+                    ))
+                    cursor.copy_expert("COPY business_users (username, email) FROM STDIN", users)
+                
+                if not has_products:
+                    products = io.StringIO(''.join(
+                        f"Product {i}\t{random.uniform(0, 1000):.2f}\t{random.randint(0, 100)}\t"
+                        f"{random.choice(PRODUCT_CATEGORIES)}\n"
+                        for i in range(1, 51)
+                    ))
+                    cursor.copy_expert(
+                        "COPY business_products (name, price, stock, category) FROM STDIN", products
+                    )
                 
                 conn.commit()
                 print(f"[{self.connection_type}] 测试表创建完成")
                 
         except Exception as e:
-            conn.rollback()
             raise Exception(f"创建测试表失败: {e}")
+        finally:
+            conn.close()
     
-    def _execute_read_operation(self) -> BusinessOperation:
-        """执行读操作"""
-        operation_id = str(uuid.uuid4())[:8]
+    def _run_operation(self, operation_type: str, body, endpoint_type: str = 'writer') -> BusinessOperation:
+        """
+        借出连接执行一个业务操作并记录结果
+        
+        body(cursor, operation) 负责执行具体的 SQL。借出连接时不做健康检查，
+        失效连接在使用时才会暴露；此时丢弃该连接，用新连接重试一次。
+        """
         operation = BusinessOperation(
-            operation_id=operation_id,
-            operation_type='read',
-            start_time=datetime.now(timezone.utc)
+            operation_id=next(self._op_counter),
+            operation_type=operation_type,
+            start_ts=self._now_ts()
         )
         
-        print(f"[{self.connection_type}] 🔍 开始读操作 {operation_id}")
-        
-        conn = self._get_connection()
+        conn = self._get_connection(endpoint_type)
         if not conn:
-            operation.end_time = datetime.now(timezone.utc)
+            operation.end_ts = self._now_ts()
             operation.error_message = "无法获取数据库连接"
-            print(f"[{self.connection_type}] ❌ 读操作 {operation_id} 失败: {operation.error_message}")
+            print(f"[{self.connection_type}] ❌ {operation_type}操作 {operation.operation_id} 失败: {operation.error_message}")
             return operation
         
-        try:
-            start_time = time.time()
-            
-            with conn.cursor() as cursor:
-                # 随机选择一种读操作
-                read_type = random.choice([
-                    'user_list',
-                    'order_summary',
-                    'product_search',
-                    'user_orders',
-                    'recent_logs'
-                ])
-                
-                if read_type == 'user_list':
-                    print(f"[{self.connection_type}] 📋 执行用户列表查询 {operation_id}")
-                    cursor.execute("""
-                        SELECT id, username, email, last_login, login_count, status
-                        FROM business_users 
-                        WHERE status = 'active'
-                        ORDER BY last_login DESC NULLS LAST
-                        LIMIT 20
-                    """)
-                    
-                elif read_type == 'order_summary':
-                    print(f"[{self.connection_type}] 📊 执行订单统计查询 {operation_id}")
-                    cursor.execute("""
-                        SELECT status, COUNT(*) as count, SUM(amount) as total_amount
-                        FROM business_orders 
-                        WHERE created_at >= CURRENT_DATE - INTERVAL '7 days'
-                        GROUP BY status
-                    """)
-                    
-                elif read_type == 'product_search':
-                    category = random.choice(['Electronics', 'Books', 'Clothing', 'Home'])
-                    print(f"[{self.connection_type}] 🔍 执行产品搜索查询 {operation_id} (类别: {category})")
-                    cursor.execute("""
-                        SELECT id, name, price, stock, category
-                        FROM business_products 
-                        WHERE category = %s AND stock > 0
-                        ORDER BY price
-                        LIMIT 10
-                    """, (category,))
-                    
-                elif read_type == 'user_orders':
-                    user_id = random.randint(1, 100)
-                    print(f"[{self.connection_type}] 👤 执行用户订单查询 {operation_id} (用户ID: {user_id})")
-                    cursor.execute("""
-                        SELECT o.id, o.order_number, o.amount, o.status, o.created_at
-                        FROM business_orders o
-                        JOIN business_users u ON o.user_id = u.id
-                        WHERE u.id = %s
-                        ORDER BY o.created_at DESC
-                        LIMIT 10
-                    """, (user_id,))
-                    
-                else:  # recent_logs
-                    print(f"[{self.connection_type}] 📝 执行最近日志查询 {operation_id}")
-                    cursor.execute("""
-                        SELECT l.action, l.details, l.created_at, u.username
-                        FROM business_logs l
-                        LEFT JOIN business_users u ON l.user_id = u.id
-                        WHERE l.created_at >= CURRENT_TIMESTAMP - INTERVAL '1 hour'
-                        ORDER BY l.created_at DESC
-                        LIMIT 50
-                    """)
-                
-                results = cursor.fetchall()
-                operation.affected_rows = len(results)
-            
-            conn.commit()
-            operation.response_time = time.time() - start_time
-            operation.success = True
-            
-        except Exception as e:
-            conn.rollback()
-            operation.error_message = str(e)
-            operation.response_time = time.time() - start_time if 'start_time' in locals() else 0
+        reusable = True
+        start_ns = time.perf_counter_ns()
+        for attempt in range(2):
+            try:
+                with conn.cursor() as cursor:
+                    body(cursor, operation)
+                conn.commit()
+                conn.uncommitted_write_rows = 0
+                operation.response_time = (time.perf_counter_ns() - start_ns) / 1e9
+                operation.success = True
+                break
+            except Exception as e:
+                # 提交失败（例如故障转移时服务端在 COMMIT 时断开）会回滚本事务中刷新的缓冲行
+                self._count_lost_write_rows(conn.uncommitted_write_rows)
+                conn.uncommitted_write_rows = 0
+                if conn.closed and attempt == 0:
+                    # 连接已被断开（例如故障转移），换一个新连接重试
+                    self._release_connection(conn, close=True)
+                    retry_conn = self._get_connection(endpoint_type)
+                    if retry_conn:
+                        conn = retry_conn
+                        continue
+                operation.response_time = (time.perf_counter_ns() - start_ns) / 1e9
+                reusable = self._rollback(conn)
+                operation.error_message = str(e)
+                break
         
-        operation.end_time = datetime.now(timezone.utc)
+        self._release_connection(conn, close=not reusable)
+        operation.end_ts = self._now_ts()
         return operation
+    
+    def _execute_read_operation(self) -> BusinessOperation:
+        """执行读操作"""
+        return self._run_operation('read', self._run_read, self.read_endpoint)
+    
+    def _run_read(self, cursor, operation: BusinessOperation):
+        """读操作的 SQL 部分"""
+        # 随机选择一种读操作
+        rnd = self._random_source()
+        read_type = rnd.rng.choice(READ_STATEMENTS)
+        
+        if read_type == 'product_search':
+            cursor.execute(BUSINESS_SQL['product_search'], (rnd.rng.choice(PRODUCT_CATEGORIES),))
+        elif read_type == 'user_orders':
+            cursor.execute(BUSINESS_SQL['user_orders'], (rnd.user_id(),))
+        else:
+            cursor.execute(BUSINESS_SQL[read_type])
+        
+        # 只需要行数：rowcount 直接取自 libpq 结果，不必把每行转换成 Python 元组
+        operation.affected_rows = cursor.rowcount
+    
     def _execute_write_operation(self) -> BusinessOperation:
         """执行写操作"""
-        operation_id = str(uuid.uuid4())[:8]
-        operation = BusinessOperation(
-            operation_id=operation_id,
-            operation_type='write',
-            start_time=datetime.now(timezone.utc)
-        )
-        
-        conn = self._get_connection()
-        if not conn:
-            operation.end_time = datetime.now(timezone.utc)
-            operation.error_message = "无法获取数据库连接"
-            return operation
+        return self._run_operation('write', self._run_write)
+    
+    def _run_write(self, cursor, operation: BusinessOperation):
+        """写操作的 SQL 部分"""
+        # 随机选择一种写操作
+        rnd = self._random_source()
+        write_type = rnd.rng.choice(WRITE_STATEMENTS)
         
-        try:
-            start_time = time.time()
+        if write_type == 'update_user_login':
+            user_id = rnd.user_id()
+            if self.write_batch_size > 1:
+                self._buffer_write(cursor, operation, 'logins', (user_id,))
+                return
+            cursor.execute(BUSINESS_SQL['update_user_login'], (user_id,))
             
-            with conn.cursor() as cursor:
-                # 随机选择一种写操作
-                write_type = random.choice([
-                    'update_user_login',
-                    'create_order',
-                    'update_product_stock',
-                    'insert_log'
-                ])
-                
-                if write_type == 'update_user_login':
-                    user_id = random.randint(1, 100)
-                    cursor.execute("""
-                        UPDATE business_users 
-                        SET last_login = CURRENT_TIMESTAMP,
-                            login_count = login_count + 1
-                        WHERE id = %s
-                    """, (user_id,))
-                    
-                elif write_type == 'create_order':
-                    user_id = random.randint(1, 100)
-                    order_number = f"ORD-{int(time.time())}-{random.randint(1000, 9999)}"
-                    amount = round(random.uniform(10.0, 1000.0), 2)
-                    cursor.execute("""
-                        INSERT INTO business_orders (user_id, order_number, amount, status)
-                        VALUES (%s, %s, %s, 'pending')
-                    """, (user_id, order_number, amount))
-                    
-                elif write_type == 'update_product_stock':
-                    product_id = random.randint(1, 50)
-                    stock_change = random.randint(-5, 10)
-                    cursor.execute("""
-                        UPDATE business_products 
-                        SET stock = GREATEST(0, stock + %s)
-                        WHERE id = %s
-                    """, (stock_change, product_id))
-                    
-                else:  # insert_log
-                    user_id = random.randint(1, 100)
-                    action = random.choice(['login', 'logout', 'view_product', 'add_to_cart', 'checkout'])
-                    details = f"User performed {action} action"
-                    ip_address = f"192.168.{random.randint(1, 255)}.{random.randint(1, 255)}"
-                    cursor.execute("""
-                        INSERT INTO business_logs (user_id, action, details, ip_address)
-                        VALUES (%s, %s, %s, %s)
-                    """, (user_id, action, details, ip_address))
-                
-                operation.affected_rows = cursor.rowcount
+        elif write_type == 'create_order':
+            user_id = rnd.user_id()
+            order_number = f"ORD-{int(time.time())}-{rnd.rng.randint(1000, 9999)}"
+            amount = round(rnd.rng.uniform(10.0, 1000.0), 2)
+            if self.write_batch_size > 1:
+                self._buffer_write(cursor, operation, 'orders', (user_id, order_number, amount, 'pending'))
+                return
+            cursor.execute(BUSINESS_SQL['create_order'], (user_id, order_number, amount))
             
-            conn.commit()
-            operation.response_time = time.time() - start_time
-            operation.success = True
+        elif write_type == 'update_product_stock':
+            product_id = rnd.product_id()
+            stock_change = rnd.rng.randint(-5, 10)
+            cursor.execute(BUSINESS_SQL['update_product_stock'], (stock_change, product_id))
             
-        except Exception as e:
-            conn.rollback()
-            operation.error_message = str(e)
-            operation.response_time = time.time() - start_time if 'start_time' in locals() else 0
+        else:  # insert_log
+            user_id = rnd.user_id()
+            action = rnd.rng.choice(['login', 'logout', 'view_product', 'add_to_cart', 'checkout'])
+            details = f"User performed {action} action"
+            ip_address = f"192.168.{rnd.rng.randint(1, 255)}.{rnd.rng.randint(1, 255)}"
+            if self.write_batch_size > 1:
+                self._buffer_write(cursor, operation, 'logs', (user_id, action, details, ip_address))
+                return
+            cursor.execute(BUSINESS_SQL['insert_log'], (user_id, action, details, ip_address))
         
-        operation.end_time = datetime.now(timezone.utc)
-        return operation
+        operation.affected_rows = cursor.rowcount
     
-    def _execute_transaction_operation(self) -> BusinessOperation:
-        """执行事务操作"""
-        operation_id = str(uuid.uuid4())[:8]
-        operation = BusinessOperation(
-            operation_id=operation_id,
-            operation_type='transaction',
-            start_time=datetime.now(timezone.utc)
-        )
-        
-        conn = self._get_connection()
-        if not conn:
-            operation.end_time = datetime.now(timezone.utc)
-            operation.error_message = "无法获取数据库连接"
-            return operation
+    def _buffer_write(self, cursor, operation: BusinessOperation, name: str, row: tuple):
+        """
+        将写入暂存到当前连接的缓冲区
         
+        攒满 write_batch_size 行，或最早一行已等待超过 write_batch_max_delay 秒时一次性写入
+        """
+        conn = cursor.connection
+        buffer = conn.write_buffers.setdefault(name, [])
+        now = time.monotonic()
+        if not buffer:
+            conn.write_buffered_at[name] = now
+        buffer.append(row)
+        if (len(buffer) >= self.write_batch_size
+                or now - conn.write_buffered_at[name] >= self.write_batch_max_delay):
+            rows = buffer[:]
+            buffer.clear()
+            try:
+                self._write_rows(cursor, name, rows)
+            except Exception:
+                # 本次操作计为失败；之前已计为成功的缓冲行同样没有写入
+                self._count_lost_write_rows(len(rows) - 1)
+                raise
+            # 之前已计为成功的行要等 _run_operation 提交成功后才算真正写入
+            conn.uncommitted_write_rows += len(rows) - 1
+            operation.affected_rows = cursor.rowcount
+    
+    def _write_rows(self, cursor, name: str, rows: List[tuple]):
+        """一次往返写入一个缓冲区的全部行"""
+        if name in BATCH_INSERT_SQL:
+            execute_values(cursor, BATCH_INSERT_SQL[name], rows, page_size=100)
+        else:
+            execute_batch(cursor, BATCH_EXECUTE_SQL[name], rows, page_size=100)
+    
+    def _flush_write_buffers(self, conn: psycopg2.extensions.connection):
+        """写入连接缓冲区中剩余的行"""
+        with conn.cursor() as cursor:
+            for name, rows in conn.write_buffers.items():
+                if rows:
+                    self._write_rows(cursor, name, rows)
+                    conn.uncommitted_write_rows += len(rows)
+                    rows.clear()
+        conn.commit()
+        conn.uncommitted_write_rows = 0
+        conn.write_buffers.clear()
+        conn.write_buffered_at.clear()
+    
+    def _drain_write_buffers(self, conn: psycopg2.extensions.connection):
+        """连接关闭前写入剩余的缓冲行，连接已断开、写入或提交失败时将这些行计入 lost_write_rows"""
+        if not any(conn.write_buffers.values()) and not conn.uncommitted_write_rows:
+            return
         try:
-            start_time = time.time()
-            
-            with conn.cursor() as cursor:
-                # 模拟一个完整的业务事务：创建订单并更新库存
-                user_id = random.randint(1, 100)
-                product_id = random.randint(1, 50)
-                quantity = random.randint(1, 5)
-                
-                # 1. 检查库存
-                cursor.execute("""
-                    SELECT stock, price FROM business_products WHERE id = %s FOR UPDATE
-                """, (product_id,))
-                result = cursor.fetchone()
-                
-                if not result:
-                    raise Exception(f"Product {product_id} not found")
-                
-                stock, price = result
-                if stock < quantity:
-                    raise Exception(f"Insufficient stock: {stock} < {quantity}")
-                
-                # 2. 创建订单
-                order_number = f"TXN-{int(time.time())}-{random.randint(1000, 9999)}"
-                total_amount = price * quantity
-                cursor.execute("""
-                    INSERT INTO business_orders (user_id, order_number, amount, status)
-                    VALUES (%s, %s, %s, 'confirmed')
-                    RETURNING id
-                """, (user_id, order_number, total_amount))
-                order_id = cursor.fetchone()[0]
-                
-                # 3. 更新库存
-                cursor.execute("""
-                    UPDATE business_products 
-                    SET stock = stock - %s
-                    WHERE id = %s
-                """, (quantity, product_id))
-                
-                # 4. 记录日志
-                cursor.execute("""
-                    INSERT INTO business_logs (user_id, action, details)
-                    VALUES (%s, 'purchase', %s)
-                """, (user_id, f"Purchased {quantity} units of product {product_id}, order {order_id}"))
-                
-                operation.affected_rows = 3  # 插入订单、更新库存、插入日志
-            
-            conn.commit()
-            operation.response_time = time.time() - start_time
-            operation.success = True
-            
+            if conn.closed:
+                raise psycopg2.InterfaceError("connection already closed")
+            self._flush_write_buffers(conn)
         except Exception as e:
-            conn.rollback()
-            operation.error_message = str(e)
-            operation.response_time = time.time() - start_time if 'start_time' in locals() else 0
+            lost = conn.uncommitted_write_rows + sum(len(rows) for rows in conn.write_buffers.values())
+            print(f"[{self.connection_type}] ⚠️ {lost} 行批量写入数据未能写入: {e}")
+            self._count_lost_write_rows(lost)
+            conn.uncommitted_write_rows = 0
+            conn.write_buffers.clear()
+            conn.write_buffered_at.clear()
+    
+    def _count_lost_write_rows(self, count: int):
+        """累加已计为成功但未写入数据库的缓冲行数"""
+        if count > 0:
+            with self.lock:
+                self.lost_write_rows += count
+    
+    def _execute_transaction_operation(self) -> BusinessOperation:
+        """执行事务操作"""
+        return self._run_operation('transaction', self._run_transaction)
+    
+    def _run_transaction(self, cursor, operation: BusinessOperation):
+        """事务操作的 SQL 部分"""
+        # 模拟一个完整的业务事务：创建订单并更新库存
+        rnd = self._random_source()
+        user_id = rnd.user_id()
+        product_id = rnd.product_id()
+        quantity = rnd.rng.randint(1, 5)
         
-        operation.end_time = datetime.now(timezone.utc)
-        return operation
+        # 扣减库存、创建订单、记录日志合并为一次往返；库存不足时整条语句不产生任何修改
+        order_number = f"TXN-{int(time.time())}-{rnd.rng.randint(1000, 9999)}"
+        cursor.execute(PURCHASE_SQL, {
+            'quantity': quantity,
+            'product_id': product_id,
+            'user_id': user_id,
+            'order_number': order_number,
+            'details': f"Purchased {quantity} units of product {product_id}, order "
+        })
+        if cursor.rowcount == 0:
+            raise Exception(f"Insufficient stock or product {product_id} not found")
+        
+        operation.affected_rows = 3  # 插入订单、更新库存、插入日志
     
-    def _choose_operation_type(self) -> str:
-        """根据权重选择操作类型"""
-        rand = random.randint(1, 100)
-        if rand <= self.read_weight:
-            return 'read'
-        elif rand <= self.read_weight + self.write_weight:
-            return 'write'
-        else:
-            return 'transaction'
+    def _random_source(self) -> RandomSource:
+        """获取当前线程的随机数源"""
+        source = getattr(self._local, 'random_source', None)
+        if source is None:
+            source = self._local.random_source = RandomSource()
+        return source
     
     def _execute_business_operation(self) -> BusinessOperation:
-        """执行一个业务操作"""
-        operation_type = self._choose_operation_type()
+        """按权重随机执行一个业务操作"""
+        rng = self._random_source().rng
+        handler = rng.choices(self._operation_handlers, cum_weights=self._operation_cum_weights)[0]
+        return handler()
+    
+    def _close_downtime(self, result: TestResult, start_ts: float, end_ts: float):
+        """记录一个已结束的停机区间（停机区间只在此处写入）"""
+        result.add_downtime_period(
+            datetime.fromtimestamp(start_ts, timezone.utc),
+            datetime.fromtimestamp(end_ts, timezone.utc),
+            end_ts - start_ts
+        )
+    
+    def _update_downtime(self, result: TestResult, operation: BusinessOperation):
+        """
+        在线检测停机：每完成一个操作推进一次连续失败状态机
         
-        if operation_type == 'read':
-            return self._execute_read_operation()
-        elif operation_type == 'write':
-            return self._execute_write_operation()
-        else:
-            return self._execute_transaction_operation()
-    def _detect_downtime(self, result: TestResult):
-        """检测停机时间"""
-        if not result.operations:
-            return
+        连续 DOWNTIME_FAILURE_THRESHOLD 次失败时从该次失败的开始时间计入停机，
+        其后第一个成功操作结束停机。任务大致按提交顺序完成，开始时间早于
+        最近一次失败的成功操作视为过期结果，不影响状态。
+        """
+        if not operation.success:
+            self._consec_failures += 1
+            if operation.start_ts > self._last_failure_ts:
+                self._last_failure_ts = operation.start_ts
+            if self._downtime_start is None and self._consec_failures >= DOWNTIME_FAILURE_THRESHOLD:
+                self._downtime_start = operation.start_ts
+                print(f"[{self.connection_type}] 🚨 连续 {self._consec_failures} 次操作失败，开始记录停机")
+        elif operation.start_ts >= self._last_failure_ts:
+            self._consec_failures = 0
+            if self._downtime_start is not None and operation.start_ts >= self._downtime_start:
+                # 停机结束
+                self._close_downtime(result, self._downtime_start, operation.start_ts)
+                print(f"[{self.connection_type}] ✅ 连接恢复，停机时长: "
+                      f"{operation.start_ts - self._downtime_start:.3f}秒")
+                self._downtime_start = None
+    
+    def _finish_downtime(self, result: TestResult):
+        """测试结束时仍在停机状态，以结束时间关闭停机区间"""
+        if self._downtime_start is not None:
+            self._close_downtime(result, self._downtime_start, result.end_time.timestamp())
+            self._downtime_start = None
+    
+    def _record_operation(self, result: TestResult, operation: BusinessOperation):
+        """汇总一个已完成操作的统计信息"""
+        result.add_operation(operation)
+        result.total_attempts += 1
         
-        # 按时间排序操作
-        operations = sorted(result.operations, key=lambda x: x.start_time)
+        # 更新统计信息
+        if operation.success:
+            result.successful_attempts += 1
+            if operation.operation_type == 'read':
+                result.successful_reads += 1
+            elif operation.operation_type == 'write':
+                result.successful_writes += 1
+            else:
+                result.successful_transactions += 1
+            
+            # 成功操作只按批次输出汇总，失败操作由各操作自行输出
+            self._success_bucket_rt_sum += operation.response_time or 0.0
+            self._success_bucket_count += 1
+            if self._success_bucket_count >= self.success_log_stride:
+                print(f"[{self.connection_type}] ✅ 最近 {self._success_bucket_count} 个操作成功，"
+                      f"平均响应时间: {self._success_bucket_rt_sum / self._success_bucket_count:.3f}秒")
+                self._success_bucket_rt_sum = 0.0
+                self._success_bucket_count = 0
+        else:
+            result.failed_attempts += 1
         
-        downtime_start = None
-        consecutive_failures = 0
-        failure_threshold = 3  # 连续3次失败认为是停机
+        # 按类型统计
+        if operation.operation_type == 'read':
+            result.read_operations += 1
+        elif operation.operation_type == 'write':
+            result.write_operations += 1
+        else:
+            result.transaction_operations += 1
         
-        for op in operations:
-            if not op.success:
-                consecutive_failures += 1
-                if consecutive_failures >= failure_threshold and downtime_start is None:
-                    downtime_start = op.start_time
-            else:
-                if downtime_start is not None:
-                    # 停机结束
-                    downtime_duration = (op.start_time - downtime_start).total_seconds()
-                    result.downtime_periods.append({
-                        'start': downtime_start,
-                        'end': op.start_time,
-                        'duration': downtime_duration
-                    })
-                    downtime_start = None
-                consecutive_failures = 0
-        
-        # 如果测试结束时仍在停机状态
-        if downtime_start is not None:
-            downtime_duration = (result.end_time - downtime_start).total_seconds()
-            result.downtime_periods.append({
-                'start': downtime_start,
-                'end': result.end_time,
-                'duration': downtime_duration
-            })
+        self._update_downtime(result, operation)
     
     def run_test(self, duration: int, concurrent_workers: int = 3) -> TestResult:
         """
@@ -578,6 +985,8 @@ class ConnectionTester:
         print(f"  持续时间: {duration}秒")
         print(f"  并发线程: {concurrent_workers}")
         print(f"  操作权重: 读{self.read_weight}% 写{self.write_weight}% 事务{self.transaction_weight}%")
+        if self.target_rate:
+            print(f"  目标速率: {self.target_rate} 次/秒")
         
         result = TestResult(
             connection_type=self.connection_type,
@@ -585,79 +994,71 @@ class ConnectionTester:
         )
         
         self.is_running = True
+        self._consec_failures = 0
+        self._last_failure_ts = 0.0
+        self._downtime_start = None
         
         try:
-            # 初始化连接池和测试表
-            self._initialize_connection_pool()
+            # 初始化连接和测试表
+            self._initialize_connections()
             self._setup_test_tables()
             
-            start_time = time.time()
+            start_ns = time.perf_counter_ns()
+            duration_ns = int(duration * 1e9)
             
             # 使用线程池执行并发操作
             with ThreadPoolExecutor(max_workers=concurrent_workers) as executor:
-                futures = []
+                futures = set()
+                max_pending = concurrent_workers * 2  # 保持任务队列
+                next_submit_ns = start_ns
+                rate_interval_ns = int(1e9 / self.target_rate) if self.target_rate else None
+                next_progress = 100
                 
-                while self.is_running and (time.time() - start_time) < duration:
-                    # 提交新的操作任务
-                    if len(futures) < concurrent_workers * 2:  # 保持任务队列
-                        future = executor.submit(self._execute_business_operation)
-                        futures.append(future)
+                while self.is_running:
+                    now_ns = time.perf_counter_ns()
+                    if now_ns - start_ns >= duration_ns:
+                        break
                     
-                    # 收集完成的任务
-                    completed_futures = []
-                    for future in futures:
-                        if future.done():
-                            try:
-                                operation = future.result(timeout=0.1)
-                                result.operations.append(operation)
-                                result.total_attempts += 1
-                                
-                                # 更新统计信息
-                                if operation.success:
-                                    result.successful_attempts += 1
-                                    if operation.operation_type == 'read':
-                                        result.successful_reads += 1
-                                    elif operation.operation_type == 'write':
-                                        result.successful_writes += 1
-                                    else:
-                                        result.successful_transactions += 1
-                                else:
-                                    result.failed_attempts += 1
-                                
-                                # 按类型统计
-                                if operation.operation_type == 'read':
-                                    result.read_operations += 1
-                                elif operation.operation_type == 'write':
-                                    result.write_operations += 1
-                                else:
-                                    result.transaction_operations += 1
-                                
-                            except Exception as e:
-                                print(f"[{self.connection_type}] 获取操作结果失败: {e}")
-                            
-                            completed_futures.append(future)
+                    # 到达提交时间时提交新的操作任务，并确定下一次提交时间以控制操作频率
+                    if now_ns >= next_submit_ns and len(futures) < max_pending:
+                        futures.add(executor.submit(self._execute_business_operation))
+                        if rate_interval_ns is None:
+                            next_submit_ns = now_ns + int(random.uniform(self.min_interval, self.max_interval) * 1e9)
+                        else:
+                            # 令牌桶：按固定速率推进提交时间，落后时最多积攒 max_pending 个令牌
+                            next_submit_ns = max(next_submit_ns, now_ns - max_pending * rate_interval_ns) + rate_interval_ns
                     
-                    # 移除已完成的任务
-                    for future in completed_futures:
-                        futures.remove(future)
+                    # 阻塞等待任务完成，直到下一次提交时间；队列已满时等到有任务完成为止
+                    if len(futures) < max_pending:
+                        timeout = max(0, min(next_submit_ns, start_ns + duration_ns) - now_ns) / 1e9
+                    else:
+                        timeout = max(0, start_ns + duration_ns - now_ns) / 1e9
+                    if not futures:
+                        # 没有进行中的任务时 wait() 会立即返回，改为休眠到下一次提交时间；
+                        # 每次最多休眠 0.1 秒，以便及时响应 is_running 被置为 False
+                        time.sleep(min(timeout, 0.1))
+                        continue
+                    done, futures = wait(futures, timeout=timeout, return_when=FIRST_COMPLETED)
                     
-                    # 控制操作频率
-                    time.sleep(random.uniform(self.min_interval, self.max_interval))
+                    # 收集完成的任务
+                    for future in done:
+                        try:
+                            self._record_operation(result, future.result())
+                        except Exception as e:
+                            print(f"[{self.connection_type}] 获取操作结果失败: {e}")
                     
                     # 每100个操作打印一次状态
-                    if result.total_attempts > 0 and result.total_attempts % 100 == 0:
+                    if result.total_attempts >= next_progress:
                         print(f"[{self.connection_type}] 已执行 {result.total_attempts} 个操作，成功率: {result.success_rate:.1f}%")
+                        next_progress += 100
+                        if self._downtime_start is not None:
+                            print(f"[{self.connection_type}] 当前已停机 {self._now_ts() - self._downtime_start:.1f}秒")
                 
                 # 等待剩余任务完成
                 for future in futures:
                     try:
                         operation = future.result(timeout=5)
-                        result.operations.append(operation)
-                        result.total_attempts += 1
-                        if operation.success:
-                            result.successful_attempts += 1
-                        else:
-                            result.failed_attempts += 1
+                        self._record_operation(result, operation)
                     except Exception as e:
                         print(f"[{self.connection_type}] 等待任务完成失败: {e}")
         
@@ -670,17 +1071,14 @@ class ConnectionTester:
         finally:
             self.is_running = False
             result.end_time = datetime.now(timezone.utc)
+            result.reconnect_attempts = self.reconnect_attempts
+            result.lost_write_rows = self.lost_write_rows
             
-            # 清理连接池
-            for conn in self.connection_pool:
-                if conn and not conn.closed:
-                    try:
-                        conn.close()
-                    except:
-                        pass
+            # 关闭所有连接
+            self._close_connections()
         
-        # 检测停机时间
-        self._detect_downtime(result)
+        # 停机区间已在运行中记录，这里只处理结束时仍未恢复的情况
+        self._finish_downtime(result)
         
         # 打印测试结果摘要
         print(f"\n[{self.connection_type}] 业务场景测试完成！")
@@ -692,6 +1090,11 @@ class ConnectionTester:
         print(f"  写操作: {result.write_operations} (成功率: {result.write_success_rate:.1f}%)")
         print(f"  事务操作: {result.transaction_operations} (成功率: {result.transaction_success_rate:.1f}%)")
         print(f"  平均响应时间: {result.average_response_time:.3f}秒")
+        print(f"  响应时间分位(桶上界): P50≤{result.percentile(50)}秒 "
+              f"P95≤{result.percentile(95)}秒 P99≤{result.percentile(99)}秒")
         print(f"  检测到的停机时间: {result.total_downtime:.3f}秒")
+        print(f"  停机期间重连尝试: {result.reconnect_attempts}")
+        if self.write_batch_size > 1:
+            print(f"  丢失的批量写入行: {result.lost_write_rows}")
         
         return result
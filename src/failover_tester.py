@@ -1,34 +1,138 @@
+import asyncio
+import math
 import threading
 import time
 import os
+import traceback
 import psycopg2
-from datetime import datetime, timezone
+import psycopg2.extensions
+from array import array
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from datetime import datetime, timedelta, timezone
 from .connection_tester import ConnectionTester, TestResult
 from .pgbench_load_generator import PgbenchLoadGenerator, PgbenchConfig
 from typing import Dict, List, Optional
 from dataclasses import dataclass
 
-@dataclass
+# 文本报告模板，生成报告时一次 format_map 填充
+REPORT_TEMPLATE = (
+    "Aurora PostgreSQL 故障转移 + pgbench 负载测试报告\n"
+    + "=" * 60 + "\n\n"
+    "测试时间: {test_time}\n\n"
+    "测试配置:\n"
+    "  测试时长: {duration}秒\n"
+    "  pgbench 客户端数: {clients}\n"
+    "  pgbench 作业数: {jobs}\n"
+    "  数据规模因子: {scale_factor}\n"
+    "  测试模式: {mode}\n"
+    "  预热时间: {warmup_time}秒\n\n"
+    "负载性能结果:\n"
+    "{load_results}"
+    "故障转移 Downtime 分析:\n"
+    "{downtime_results}"
+    "{downtime_comparison}"
+    "{load_comparison}"
+)
+
+LOAD_RESULT_TEMPLATE = (
+    "  {conn_type} 连接:\n"
+    "    平均 TPS: {avg_tps:.2f}\n"
+    "    最大 TPS: {max_tps:.2f}\n"
+    "    最小 TPS: {min_tps:.2f}\n"
+    "    平均延迟: {avg_latency_ms:.2f}ms\n"
+    "    最大延迟: {max_latency_ms:.2f}ms\n"
+    "    最小延迟: {min_latency_ms:.2f}ms\n"
+    "    错误数量: {error_count}\n"
+    "    采样数量: {sample_count}\n\n"
+)
+
+DOWNTIME_RESULT_TEMPLATE = (
+    "  {conn_type} 连接:\n"
+    "    总 downtime: {total_downtime:.3f}秒\n"
+    "    中断次数: {downtime_count}\n"
+    "{details}\n"
+)
+
+DOWNTIME_DETAILS_TEMPLATE = (
+    "    平均 downtime: {avg_downtime:.3f}秒\n"
+    "    最长 downtime: {max_downtime:.3f}秒\n"
+    "    最短 downtime: {min_downtime:.3f}秒\n"
+    "    详细记录:\n"
+    "{records}"
+)
+
+DOWNTIME_RECORD_TEMPLATE = "      #{index}: {start} - {end} ({duration:.3f}秒)\n"
+
+DOWNTIME_COMPARISON_TEMPLATE = (
+    "Downtime 对比分析:\n"
+    "  Direct 连接总 downtime: {direct:.3f}秒\n"
+    "  Proxy 连接总 downtime: {proxy:.3f}秒\n"
+    "{conclusion}"
+)
+
+LOAD_COMPARISON_TEMPLATE = (
+    "  TPS 变化 (Proxy vs Direct): {tps_change}\n"
+    "  延迟变化 (Proxy vs Direct): {latency_change}\n"
+)
+
+
+def _format_change(value: float, baseline: float) -> str:
+    """相对变化百分比；基准为 0（例如 Direct 负载在故障期间没有完成任何事务）时无法计算"""
+    if not baseline:
+        return "N/A (Direct 为 0)"
+    return f"{(value - baseline) / baseline * 100:+.2f}%"
+
+
+@dataclass(slots=True)
 class DowntimeRecord:
     """停机时间记录"""
     connection_type: str
-    start_time: datetime
-    end_time: Optional[datetime] = None
+    start_ns: int  # time.monotonic_ns()，生成报告时再换算为墙上时间
+    end_ns: Optional[int] = None
     duration: Optional[float] = None
     
-    def finalize(self, end_time: datetime):
+    def finalize(self, end_ns: int):
         """完成停机记录"""
-        self.end_time = end_time
-        self.duration = (end_time - self.start_time).total_seconds()
+        self.end_ns = end_ns
+        self.duration = (end_ns - self.start_ns) / 1e9
+
+@dataclass(slots=True)
+class DowntimeStats:
+    """单个连接类型的停机汇总，随每条停机记录增量更新"""
+    total: float = 0.0
+    count: int = 0
+    max: float = 0.0
+    min: float = float('inf')
+    active: int = 0  # 进行中的停机数
+    
+    def record(self, duration: float):
+        """计入一次已结束的停机"""
+        self.total += duration
+        self.count += 1
+        if duration > self.max:
+            self.max = duration
+        if duration < self.min:
+            self.min = duration
+    
+    @property
+    def mean(self) -> float:
+        return self.total / self.count if self.count else 0.0
 
 class FailoverTester:
     """故障转移测试器，能够精确监控每种连接类型的downtime"""
     
     def __init__(self, config):
         self.config = config
+        # 验证连接和 downtime 监控连接与业务测试使用同一套 TLS 与 keepalive 参数
+        self.connection_options = config.get_connection_options()
         self.connection_testers = {}
         self.downtime_monitors = {}
-        self.downtime_records = {'direct': [], 'proxy': []}
+        # 已结束的停机记录按列存储：开始/结束时间（time.monotonic_ns）和时长（秒）
+        self.downtime_start_ns = {'direct': array('q'), 'proxy': array('q')}
+        self.downtime_end_ns = {'direct': array('q'), 'proxy': array('q')}
+        self.downtime_durations = {'direct': array('d'), 'proxy': array('d')}
+        self.downtime_stats = {conn_type: DowntimeStats() for conn_type in self.downtime_durations}
         
         # 根据测试模式创建相应的连接测试器
         if config.mode in ['direct', 'both']:
@@ -39,13 +143,36 @@ class FailoverTester:
         self.load_generator = PgbenchLoadGenerator(config.pgbench_config)
         self.results = {}
         self.test_running = False
-        self.monitor_threads = {}
+        self._stop_event = threading.Event()  # 设置后预热和主测试阶段立即结束
+        self._monitor_pool = None    # 运行监控事件循环的线程池，跨多次测试复用
+        self._monitor_future = None
+        self._monitor_loop = None
+        self._monitor_stop = None
+        
+        # 单调时钟与墙上时钟的对应基准，停机记录只保存单调时间戳
+        self._wall_anchor = datetime.now(timezone.utc)
+        self._monotonic_anchor_ns = time.monotonic_ns()
+        
+        # run_test 期间被替换掉的 threading.excepthook，结束时恢复
+        self._previous_excepthook = None
+    
+    def _thread_excepthook(self, args):
+        """记录后台线程的未捕获异常，再交给原来的处理函数输出"""
+        thread_name = args.thread.name if args.thread is not None else 'unknown'
+        error = ''.join(traceback.format_exception_only(args.exc_type, args.exc_value)).strip()
+        self.results.setdefault('thread_errors', []).append(f"{thread_name}: {error}")
+        self._previous_excepthook(args)
     
     def run_test(self):
         """运行完整测试"""
         print("🎯 Aurora 故障转移 + pgbench 负载测试")
         print("=" * 60)
         
+        self._stop_event.clear()
+        # 后台线程（如 pgbench 输出解析线程）中的未捕获异常无法传播到 run_test，
+        # 测试期间记录到 results['thread_errors']，结束后恢复原来的处理函数
+        self._previous_excepthook = threading.excepthook
+        threading.excepthook = self._thread_excepthook
         try:
             # 1. 准备阶段
             self._prepare_phase()
@@ -62,12 +189,13 @@ class FailoverTester:
         except KeyboardInterrupt:
             print("\n⚠️ 测试被用户中断")
         except Exception as e:
+            # 只记录一行，堆栈由调用方输出；资源在 finally 中清理
             print(f"\n❌ 测试过程中发生错误: {e}")
-            import traceback
-            traceback.print_exc()
+            raise
         finally:
             # 清理资源
             self._cleanup()
+            threading.excepthook = self._previous_excepthook
     
     def _prepare_phase(self):
         """准备阶段"""
@@ -87,55 +215,85 @@ class FailoverTester:
         print("✅ 准备阶段完成")
     
     def _verify_connections(self):
-        """验证数据库连接"""
-        for conn_type, conn_config in self.config.pgbench_config.connections.items():
-            try:
-                conn = psycopg2.connect(
-                    host=conn_config['host'],
-                    port=conn_config['port'],
-                    user=conn_config['user'],
-                    password=conn_config.get('password', ''),
-                    database=conn_config['database'],
-                    connect_timeout=2
-                )
-                conn.close()
-                print(f"   ✅ {conn_type} 连接验证成功")
-            except Exception as e:
-                print(f"   ❌ {conn_type} 连接验证失败: {e}")
-                raise
+        """验证数据库连接，各连接类型并行验证，总耗时不随连接数增加"""
+        connections = self.config.pgbench_config.connections
+        with ThreadPoolExecutor(max_workers=len(connections)) as executor:
+            futures = {
+                executor.submit(self._test_one_connection, conn_config): conn_type
+                for conn_type, conn_config in connections.items()
+            }
+            errors = []
+            for future in as_completed(futures):
+                conn_type = futures[future]
+                try:
+                    future.result()
+                    print(f"   ✅ {conn_type} 连接验证成功")
+                except Exception as e:
+                    print(f"   ❌ {conn_type} 连接验证失败: {e}")
+                    errors.append(e)
+        
+        if errors:
+            raise errors[0]
+    
+    def _test_one_connection(self, conn_config: dict):
+        """建立一次连接后立即关闭，失败时抛出异常"""
+        conn = psycopg2.connect(
+            host=conn_config['host'],
+            port=conn_config['port'],
+            user=conn_config['user'],
+            password=conn_config.get('password', ''),
+            database=conn_config['database'],
+            connect_timeout=2,
+            **self.connection_options
+        )
+        conn.close()
     
     def _warmup_phase(self):
         """预热阶段"""
-        print(f"\n🔥 预热阶段 ({self.config.pgbench_config.warmup_time}秒)")
+        warmup_time = self.config.pgbench_config.warmup_time
+        get_metrics = self.load_generator.get_current_metrics
+        stop_event = self._stop_event
+        
+        print(f"\n🔥 预热阶段 ({warmup_time}秒)")
         print("-" * 20)
         
         # 启动负载生成
         self.load_generator.start_load_generation()
         
-        # 等待预热完成
-        warmup_start = time.time()
-        last_report_time = warmup_start
+        # 等待预热完成：只在需要报告或预热结束时醒来，收到停止信号时提前退出
+        warmup_start = time.monotonic()
+        warmup_end = warmup_start + warmup_time
+        next_report_time = warmup_start + 10
         
-        while time.time() - warmup_start < self.config.pgbench_config.warmup_time:
-            current_time = time.time()
+        while True:
+            current_time = time.monotonic()
+            if current_time >= warmup_end:
+                break
             
             # 每10秒报告一次预热状态
-            if current_time - last_report_time >= 10:
+            if current_time >= next_report_time:
                 elapsed = int(current_time - warmup_start)
-                remaining = self.config.pgbench_config.warmup_time - elapsed
-                metrics = self.load_generator.get_current_metrics()
+                remaining = warmup_time - elapsed
+                metrics = get_metrics()
                 
-                print(f"   预热中... {elapsed}s/{self.config.pgbench_config.warmup_time}s (剩余 {remaining}s)")
+                print(f"   预热中... {elapsed}s/{warmup_time}s (剩余 {remaining}s)")
                 self._print_current_metrics(metrics, indent="     ")
-                last_report_time = current_time
+                # 报告耗时或进程被挂起导致落后时，跳过已错过的报告时间点
+                next_report_time += ((current_time - next_report_time) // 10 + 1) * 10
             
-            time.sleep(1)
+            next_wake = min(warmup_end, next_report_time)
+            if stop_event.wait(timeout=max(0, next_wake - current_time)):
+                break
         
         print("✅ 预热阶段完成，开始正式测试")
     
     def _main_test_phase(self):
         """主测试阶段"""
-        print(f"\n🚀 主测试阶段 ({self.config.duration}秒)")
+        duration = self.config.duration
+        get_metrics = self.load_generator.get_current_metrics
+        stop_event = self._stop_event
+        
+        print(f"\n🚀 主测试阶段 ({duration}秒)")
         print("-" * 20)
         print("💡 请在另一个终端手动触发故障转移:")
         print("   aws rds failover-db-cluster --db-cluster-identifier ards-with-rdsproxy --region ap-southeast-1")
@@ -143,115 +301,255 @@ class FailoverTester:
         
         self.test_running = True
         
-        # 启动每种连接类型的独立downtime监控线程
-        for conn_type in self.config.pgbench_config.connections.keys():
-            monitor_thread = threading.Thread(
-                target=self._monitor_connection_downtime,
-                args=(conn_type,)
-            )
-            monitor_thread.daemon = True
-            monitor_thread.start()
-            self.monitor_threads[conn_type] = monitor_thread
+        # 所有连接类型的downtime监控在同一个线程的事件循环中运行
+        if self._monitor_pool is None:
+            self._monitor_pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix='dt-monitor')
+        self._monitor_future = self._monitor_pool.submit(self._run_monitors)
         
-        # 主循环：监控负载性能
-        start_time = time.time()
-        last_report_time = start_time
+        # 主循环：监控负载性能，只在需要报告或测试结束时醒来
+        start_time = time.monotonic()
+        end_time = start_time + duration
+        next_report_time = start_time + 5
         
-        while time.time() - start_time < self.config.duration:
-            current_time = time.time()
+        while True:
+            current_time = time.monotonic()
+            if current_time >= end_time:
+                break
             
             # 每5秒报告一次性能
-            if current_time - last_report_time >= 5:
-                metrics = self.load_generator.get_current_metrics()
+            if current_time >= next_report_time:
+                metrics = get_metrics()
                 elapsed = int(current_time - start_time)
-                remaining = self.config.duration - elapsed
+                remaining = duration - elapsed
                 
-                print(f"\n⏱️  测试进行中... ({elapsed}s/{self.config.duration}s, 剩余 {remaining}s)")
+                print(f"\n⏱️  测试进行中... ({elapsed}s/{duration}s, 剩余 {remaining}s)")
                 self._print_current_metrics(metrics)
                 
                 # 显示当前的downtime状态
                 self._print_downtime_status()
                 
-                last_report_time = current_time
+                # 报告耗时或进程被挂起导致落后时，跳过已错过的报告时间点
+                next_report_time += ((current_time - next_report_time) // 5 + 1) * 5
             
-            time.sleep(1)
+            next_wake = min(end_time, next_report_time)
+            if stop_event.wait(timeout=max(0, next_wake - current_time)):
+                break
         
         self.test_running = False
+        self._stop_monitors()
         print("\n✅ 主测试阶段完成")
     
-    def _monitor_connection_downtime(self, conn_type: str):
-        """监控特定连接类型的downtime"""
+    def _run_monitors(self):
+        """监控线程入口：在独立的事件循环中运行所有连接类型的监控任务"""
+        # 将监控线程绑定到指定 CPU，减少被负载进程抢占造成的调度抖动被计入 downtime
+        monitor_cpu = getattr(self.config, 'monitor_cpu', None)
+        if monitor_cpu is not None:
+            try:
+                os.sched_setaffinity(0, {monitor_cpu})
+            except (AttributeError, OSError):
+                pass
+        asyncio.run(self._monitor_all())
+    
+    async def _monitor_all(self):
+        """为每种连接类型创建一个监控任务，直到收到停止信号"""
+        self._monitor_loop = asyncio.get_running_loop()
+        self._monitor_stop = asyncio.Event()
+        # 各任务共用同一个起点，按相同的时间网格发出探测，不同连接类型的探测同时在途，互不漂移
+        start = self._monitor_loop.time()
+        await asyncio.gather(*(
+            self._monitor_connection_downtime(conn_type, start)
+            for conn_type in self.config.pgbench_config.connections
+        ))
+    
+    def _stop_monitors(self, timeout: float = 5.0):
+        """通知监控事件循环停止，并等待各监控任务完成停机记录"""
+        loop, stop = self._monitor_loop, self._monitor_stop
+        if loop is not None and stop is not None:
+            try:
+                loop.call_soon_threadsafe(stop.set)
+            except RuntimeError:
+                pass  # 事件循环已经结束
+        future, self._monitor_future = self._monitor_future, None
+        if future is None:
+            return
+        try:
+            future.result(timeout)
+        except FutureTimeoutError:
+            print(f"   ⚠️ downtime 监控在 {timeout} 秒内未能停止")
+        except Exception as e:
+            # 线程池中的异常不会经过 threading.excepthook，在这里记录
+            error = ''.join(traceback.format_exception_only(type(e), e)).strip()
+            self.results.setdefault('thread_errors', []).append(f"dt-monitor: {error}")
+    
+    async def _monitor_connection_downtime(self, conn_type: str, start: float):
+        """
+        监控特定连接类型的downtime
+        
+        Args:
+            conn_type: 连接类型
+            start: 探测时间网格的起点（事件循环时间）
+        """
         print(f"🔍 开始监控 {conn_type} 连接的downtime...")
         
         conn_config = self.config.pgbench_config.connections[conn_type]
         current_downtime = None
-        check_interval = 0.1  # 100ms检查间隔
+        # 检查间隔：正常时 100ms，决定停机开始时间的最大误差（即工具标称的精度）；
+        # 停机期间缩短到 20ms 以精确捕捉恢复时间。两个间隔互为整数倍，各连接类型的探测仍落在同一时间网格上
+        normal_interval = 0.1
+        downtime_interval = 0.02
+        probe_timeout = 1.0  # 单次探测（连接或查询）的超时时间
+        stop = self._monitor_stop
+        stats = self.downtime_stats[conn_type]
+        connect_monitor = self._connect_monitor
+        wait_async = self._wait_async
+        loop = asyncio.get_running_loop()
         
-        while self.test_running:
+        # 监控连接长期复用，只有探测失败后才重新建立，避免每次探测都重新握手和认证
+        conn = None
+        cursor = None
+        
+        # test_running 兜底：停止信号可能早于事件循环创建发出
+        while not stop.is_set() and self.test_running:
+            # 探测发起时间：探测失败时停机从这里算起，而不是从观察到失败（可能已等待 probe_timeout）算起
+            probe_ns = time.monotonic_ns()
             try:
-                # 尝试连接
-                conn = psycopg2.connect(
-                    host=conn_config['host'],
-                    port=conn_config['port'],
-                    user=conn_config['user'],
-                    password=conn_config.get('password', ''),
-                    database=conn_config['database'],
-                    connect_timeout=1
-                )
+                if conn is None:
+                    conn, cursor = await connect_monitor(conn_config, probe_timeout)
                 
-                # 执行简单查询
-                with conn.cursor() as cursor:
-                    cursor.execute("SELECT 1")
-                    cursor.fetchone()
-                
-                conn.close()
+                # 执行探测语句：异步发送后等待套接字就绪，超过 probe_timeout 未返回视为失败
+                cursor.execute("SELECT 1")
+                await wait_async(conn, probe_timeout)
+                cursor.fetchone()
                 
                 # 连接成功
                 if current_downtime is not None:
                     # 结束当前的downtime记录
-                    current_downtime.finalize(datetime.now(timezone.utc))
-                    self.downtime_records[conn_type].append(current_downtime)
+                    self._finish_downtime(current_downtime)
                     print(f"   ✅ {conn_type} 连接恢复，downtime: {current_downtime.duration:.3f}秒")
                     current_downtime = None
                 
             except Exception as e:
-                # 连接失败
+                # 连接失败，丢弃失效的连接，下次循环重新连接
+                if conn is not None:
+                    try:
+                        conn.close()
+                    except Exception:
+                        pass
+                    conn = None
+                    cursor = None
+                
                 if current_downtime is None:
                     # 开始新的downtime记录
                     current_downtime = DowntimeRecord(
                         connection_type=conn_type,
-                        start_time=datetime.now(timezone.utc)
+                        start_ns=probe_ns
                     )
+                    stats.active += 1
                     print(f"   🚨 {conn_type} 连接失败，开始记录downtime: {e}")
             
-            time.sleep(check_interval)
+            check_interval = downtime_interval if current_downtime is not None else normal_interval
+            
+            # 等到网格上的下一个探测时间；探测耗时超过间隔时跳过已错过的时间点
+            now = loop.time()
+            next_probe = start + ((now - start) // check_interval + 1) * check_interval
+            await asyncio.sleep(next_probe - now)
+        
+        if conn is not None:
+            conn.close()
         
         # 测试结束时，如果还有未完成的downtime记录，完成它
         if current_downtime is not None:
-            current_downtime.finalize(datetime.now(timezone.utc))
-            self.downtime_records[conn_type].append(current_downtime)
+            self._finish_downtime(current_downtime)
             print(f"   ⚠️ 测试结束时 {conn_type} 仍在downtime，总时长: {current_downtime.duration:.3f}秒")
     
+    def _finish_downtime(self, record: DowntimeRecord):
+        """结束一条停机记录，并计入对应连接类型的汇总"""
+        record.finalize(time.monotonic_ns())
+        conn_type = record.connection_type
+        self.downtime_start_ns[conn_type].append(record.start_ns)
+        self.downtime_end_ns[conn_type].append(record.end_ns)
+        self.downtime_durations[conn_type].append(record.duration)
+        stats = self.downtime_stats[conn_type]
+        stats.active -= 1
+        stats.record(record.duration)
+    
+    async def _connect_monitor(self, conn_config: dict, timeout: float = 1.0):
+        """
+        建立 downtime 监控使用的异步连接
+        
+        异步连接总是自动提交，连接和查询都通过 _wait_async 等待完成，
+        故障转移期间无响应的服务端不会阻塞事件循环中的其他监控任务。
+        探测使用普通 SELECT 1（服务端 PREPARE 会让 RDS 代理固定会话），返回 (连接, 复用的游标)。
+        """
+        conn = psycopg2.connect(
+            host=conn_config['host'],
+            port=conn_config['port'],
+            user=conn_config['user'],
+            password=conn_config.get('password', ''),
+            database=conn_config['database'],
+            async_=1,
+            **self.connection_options
+        )
+        try:
+            await self._wait_async(conn, timeout)
+            cursor = conn.cursor()
+        except BaseException:
+            conn.close()
+            raise
+        return conn, cursor
+    
+    @staticmethod
+    async def _wait_async(conn, timeout: float):
+        """
+        轮询异步连接直到当前操作完成，超过 timeout 秒抛出 OperationalError
+        
+        套接字就绪由事件循环通知（add_reader/add_writer），等待期间不占用线程。
+        """
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout
+        fd = conn.fileno()
+        while True:
+            state = conn.poll()
+            if state == psycopg2.extensions.POLL_OK:
+                return
+            if state == psycopg2.extensions.POLL_READ:
+                add, remove = loop.add_reader, loop.remove_reader
+            elif state == psycopg2.extensions.POLL_WRITE:
+                add, remove = loop.add_writer, loop.remove_writer
+            else:
+                raise psycopg2.OperationalError(f"异步连接状态异常: {state}")
+            
+            ready = loop.create_future()
+            add(fd, lambda: ready.done() or ready.set_result(None))
+            try:
+                await asyncio.wait_for(ready, deadline - loop.time())
+            except asyncio.TimeoutError:
+                raise psycopg2.OperationalError("探测超时") from None
+            finally:
+                remove(fd)
+    
     def _print_current_metrics(self, metrics: dict, indent: str = "   "):
         """打印当前性能指标"""
+        # 所有连接类型的指标拼成一段文本，一次输出
+        lines = []
         for conn_type, data in metrics.items():
             if data['sample_count'] > 0:
-                print(f"{indent}{conn_type:>6}: TPS={data['avg_tps']:>7.1f} "
-                      f"(max:{data['max_tps']:>7.1f}), "
-                      f"延迟={data['avg_latency_ms']:>6.2f}ms "
-                      f"(max:{data['max_latency_ms']:>6.2f}ms), "
-                      f"错误={data['error_count']:>3d}")
+                lines.append(f"{indent}{conn_type:>6}: TPS={data['avg_tps']:>7.1f} "
+                             f"(max:{data['max_tps']:>7.1f}), "
+                             f"延迟={data['avg_latency_ms']:>6.2f}ms "
+                             f"(max:{data['max_latency_ms']:>6.2f}ms), "
+                             f"错误={data['error_count']:>3d}")
             else:
-                print(f"{indent}{conn_type:>6}: 等待数据...")
+                lines.append(f"{indent}{conn_type:>6}: 等待数据...")
+        if lines:
+            print('\n'.join(lines))
     
     def _print_downtime_status(self):
         """打印当前downtime状态"""
-        for conn_type, records in self.downtime_records.items():
-            if records:
-                total_downtime = sum(record.duration for record in records if record.duration)
-                active_downtime = len([r for r in records if r.end_time is None])
-                print(f"   📊 {conn_type} downtime: 总计 {total_downtime:.3f}秒 "
-                      f"({len(records)}次中断, {active_downtime}次进行中)")
+        for conn_type, stats in self.downtime_stats.items():
+            if stats.count or stats.active:
+                print(f"   📊 {conn_type} downtime: 总计 {stats.total:.3f}秒 "
+                      f"({stats.count + stats.active}次中断, {stats.active}次进行中)")
     
     def _analyze_results(self):
         """分析结果"""
@@ -262,142 +560,133 @@ class FailoverTester:
         final_metrics = self.load_generator.get_current_metrics()
         self.results['load_metrics'] = final_metrics
         
-        # 获取详细指标
-        detailed_metrics = self.load_generator.get_detailed_metrics()
-        self.results['detailed_metrics'] = detailed_metrics
-        
         # 整理downtime信息
         self.results['downtime_analysis'] = self._analyze_downtime()
         
         # 生成报告
         self._generate_report()
     
+    def _monotonic_to_datetime(self, monotonic_ns: int) -> datetime:
+        """将 time.monotonic_ns() 时间戳换算为 UTC 时间"""
+        return self._wall_anchor + timedelta(microseconds=(monotonic_ns - self._monotonic_anchor_ns) // 1000)
+    
     def _analyze_downtime(self) -> Dict:
         """分析downtime数据"""
         analysis = {}
         
-        for conn_type, records in self.downtime_records.items():
-            if records:
-                durations = [r.duration for r in records if r.duration is not None]
-                analysis[conn_type] = {
-                    'total_downtime': sum(durations),
-                    'downtime_count': len(records),
-                    'avg_downtime': sum(durations) / len(durations) if durations else 0,
-                    'max_downtime': max(durations) if durations else 0,
-                    'min_downtime': min(durations) if durations else 0,
-                    'records': [
-                        {
-                            'start': r.start_time.strftime('%H:%M:%S.%f')[:-3],
-                            'end': r.end_time.strftime('%H:%M:%S.%f')[:-3] if r.end_time else 'N/A',
-                            'duration': r.duration
-                        }
-                        for r in records
-                    ]
-                }
-            else:
-                analysis[conn_type] = {
-                    'total_downtime': 0,
-                    'downtime_count': 0,
-                    'avg_downtime': 0,
-                    'max_downtime': 0,
-                    'min_downtime': 0,
-                    'records': []
-                }
+        for conn_type, stats in self.downtime_stats.items():
+            # 最终报告的总时长用 fsum 对全部时长精确求和，运行中的状态输出使用增量累计值
+            total = math.fsum(self.downtime_durations[conn_type]) if stats.count else 0.0
+            analysis[conn_type] = {
+                'total_downtime': total,
+                'downtime_count': stats.count,
+                'avg_downtime': total / stats.count if stats.count else 0,
+                'max_downtime': stats.max,
+                'min_downtime': stats.min if stats.count else 0,
+                'records': [
+                    {
+                        'start': self._monotonic_to_datetime(start_ns).time().isoformat(timespec='milliseconds'),
+                        'end': self._monotonic_to_datetime(end_ns).time().isoformat(timespec='milliseconds'),
+                        'duration': duration
+                    }
+                    for start_ns, end_ns, duration in zip(
+                        self.downtime_start_ns[conn_type],
+                        self.downtime_end_ns[conn_type],
+                        self.downtime_durations[conn_type]
+                    )
+                ]
+            }
         
         return analysis
     
     def _generate_report(self):
         """生成测试报告"""
-        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+        # 文件名和报告中的测试时间使用同一时刻
+        now = datetime.now()
+        timestamp = now.strftime("%Y%m%d_%H%M%S")
         filename = f"results/pgbench_failover_report_{timestamp}.txt"
         
         print(f"📄 生成测试报告: {filename}")
         
-        with open(filename, 'w', encoding='utf-8') as f:
-            f.write("Aurora PostgreSQL 故障转移 + pgbench 负载测试报告\n")
-            f.write("=" * 60 + "\n\n")
-            
-            # 测试时间
-            f.write(f"测试时间: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}\n\n")
-            
-            # 测试配置
-            f.write("测试配置:\n")
-            f.write(f"  测试时长: {self.config.duration}秒\n")
-            f.write(f"  pgbench 客户端数: {self.config.pgbench_config.clients}\n")
-            f.write(f"  pgbench 作业数: {self.config.pgbench_config.jobs}\n")
-            f.write(f"  数据规模因子: {self.config.pgbench_config.scale_factor}\n")
-            f.write(f"  测试模式: {self.config.pgbench_config.mode}\n")
-            f.write(f"  预热时间: {self.config.pgbench_config.warmup_time}秒\n\n")
-            
-            # 负载性能结果
-            f.write("负载性能结果:\n")
-            for conn_type, metrics in self.results['load_metrics'].items():
-                f.write(f"  {conn_type} 连接:\n")
-                f.write(f"    平均 TPS: {metrics['avg_tps']:.2f}\n")
-                f.write(f"    最大 TPS: {metrics['max_tps']:.2f}\n")
-                f.write(f"    最小 TPS: {metrics['min_tps']:.2f}\n")
-                f.write(f"    平均延迟: {metrics['avg_latency_ms']:.2f}ms\n")
-                f.write(f"    最大延迟: {metrics['max_latency_ms']:.2f}ms\n")
-                f.write(f"    最小延迟: {metrics['min_latency_ms']:.2f}ms\n")
-                f.write(f"    错误数量: {metrics['error_count']}\n")
-                f.write(f"    采样数量: {metrics['sample_count']}\n\n")
-            
-            # 详细的downtime分析
-            f.write("故障转移 Downtime 分析:\n")
-            downtime_analysis = self.results['downtime_analysis']
+        pgbench_config = self.config.pgbench_config
+        load_metrics = self.results['load_metrics']
+        downtime_analysis = self.results['downtime_analysis']
+        
+        # 负载性能结果
+        load_results = ''.join(
+            LOAD_RESULT_TEMPLATE.format_map(dict(metrics, conn_type=conn_type))
+            for conn_type, metrics in load_metrics.items()
+        )
+        
+        # 详细的downtime分析
+        downtime_results = []
+        for conn_type, analysis in downtime_analysis.items():
+            if analysis['downtime_count'] > 0:
+                records = ''.join(
+                    DOWNTIME_RECORD_TEMPLATE.format_map(dict(record, index=i))
+                    for i, record in enumerate(analysis['records'], 1)
+                )
+                details = DOWNTIME_DETAILS_TEMPLATE.format_map(dict(analysis, records=records))
+            else:
+                details = "    无中断记录\n"
+            downtime_results.append(
+                DOWNTIME_RESULT_TEMPLATE.format_map(dict(analysis, conn_type=conn_type, details=details))
+            )
+        
+        # 对比分析
+        downtime_comparison = ''
+        if len(downtime_analysis) == 2:
+            direct_downtime = downtime_analysis.get('direct', {}).get('total_downtime', 0)
+            proxy_downtime = downtime_analysis.get('proxy', {}).get('total_downtime', 0)
             
-            for conn_type, analysis in downtime_analysis.items():
-                f.write(f"  {conn_type} 连接:\n")
-                f.write(f"    总 downtime: {analysis['total_downtime']:.3f}秒\n")
-                f.write(f"    中断次数: {analysis['downtime_count']}\n")
-                if analysis['downtime_count'] > 0:
-                    f.write(f"    平均 downtime: {analysis['avg_downtime']:.3f}秒\n")
-                    f.write(f"    最长 downtime: {analysis['max_downtime']:.3f}秒\n")
-                    f.write(f"    最短 downtime: {analysis['min_downtime']:.3f}秒\n")
-                    f.write("    详细记录:\n")
-                    for i, record in enumerate(analysis['records'], 1):
-                        f.write(f"      #{i}: {record['start']} - {record['end']} "
-                               f"({record['duration']:.3f}秒)\n")
+            if direct_downtime > 0 and proxy_downtime > 0:
+                improvement = ((direct_downtime - proxy_downtime) / direct_downtime) * 100
+                conclusion = f"  Proxy 相对 Direct 的改善: {improvement:+.1f}%\n"
+                if improvement > 0:
+                    conclusion += "  结论: RDS Proxy 在故障转移时表现更好，downtime 更短\n"
                 else:
-                    f.write("    无中断记录\n")
-                f.write("\n")
+                    conclusion += "  结论: Direct 连接在故障转移时表现更好，downtime 更短\n"
+            elif direct_downtime == 0 and proxy_downtime == 0:
+                conclusion = "  结论: 两种连接方式都没有检测到 downtime\n"
+            elif direct_downtime == 0:
+                conclusion = "  结论: Direct 连接没有 downtime，Proxy 连接有 downtime\n"
+            else:
+                conclusion = "  结论: Proxy 连接没有 downtime，Direct 连接有 downtime\n"
             
-            # 对比分析
-            if len(downtime_analysis) == 2:
-                f.write("Downtime 对比分析:\n")
-                direct_downtime = downtime_analysis.get('direct', {}).get('total_downtime', 0)
-                proxy_downtime = downtime_analysis.get('proxy', {}).get('total_downtime', 0)
-                
-                f.write(f"  Direct 连接总 downtime: {direct_downtime:.3f}秒\n")
-                f.write(f"  Proxy 连接总 downtime: {proxy_downtime:.3f}秒\n")
-                
-                if direct_downtime > 0 and proxy_downtime > 0:
-                    improvement = ((direct_downtime - proxy_downtime) / direct_downtime) * 100
-                    f.write(f"  Proxy 相对 Direct 的改善: {improvement:+.1f}%\n")
-                    
-                    if improvement > 0:
-                        f.write("  结论: RDS Proxy 在故障转移时表现更好，downtime 更短\n")
-                    else:
-                        f.write("  结论: Direct 连接在故障转移时表现更好，downtime 更短\n")
-                elif direct_downtime == 0 and proxy_downtime == 0:
-                    f.write("  结论: 两种连接方式都没有检测到 downtime\n")
-                elif direct_downtime == 0:
-                    f.write("  结论: Direct 连接没有 downtime，Proxy 连接有 downtime\n")
-                elif proxy_downtime == 0:
-                    f.write("  结论: Proxy 连接没有 downtime，Direct 连接有 downtime\n")
+            downtime_comparison = DOWNTIME_COMPARISON_TEMPLATE.format(
+                direct=direct_downtime, proxy=proxy_downtime, conclusion=conclusion
+            )
+        
+        # 性能对比（如果有两种连接类型）
+        load_comparison = ''
+        if len(load_metrics) == 2:
+            load_comparison = "\n负载性能对比分析:\n"
+            direct_metrics = load_metrics.get('direct', {})
+            proxy_metrics = load_metrics.get('proxy', {})
             
-            # 性能对比（如果有两种连接类型）
-            if len(self.results['load_metrics']) == 2:
-                f.write("\n负载性能对比分析:\n")
-                direct_metrics = self.results['load_metrics'].get('direct', {})
-                proxy_metrics = self.results['load_metrics'].get('proxy', {})
-                
-                if direct_metrics and proxy_metrics:
-                    tps_improvement = ((proxy_metrics['avg_tps'] - direct_metrics['avg_tps']) / direct_metrics['avg_tps']) * 100
-                    latency_change = ((proxy_metrics['avg_latency_ms'] - direct_metrics['avg_latency_ms']) / direct_metrics['avg_latency_ms']) * 100
-                    
-                    f.write(f"  TPS 变化 (Proxy vs Direct): {tps_improvement:+.2f}%\n")
-                    f.write(f"  延迟变化 (Proxy vs Direct): {latency_change:+.2f}%\n")
+            if direct_metrics and proxy_metrics:
+                load_comparison += LOAD_COMPARISON_TEMPLATE.format(
+                    tps_change=_format_change(proxy_metrics['avg_tps'], direct_metrics['avg_tps']),
+                    latency_change=_format_change(proxy_metrics['avg_latency_ms'], direct_metrics['avg_latency_ms'])
+                )
+        
+        report = REPORT_TEMPLATE.format_map({
+            'test_time': now.strftime('%Y-%m-%d %H:%M:%S'),
+            'duration': self.config.duration,
+            'clients': pgbench_config.clients,
+            'jobs': pgbench_config.jobs,
+            'scale_factor': pgbench_config.scale_factor,
+            'mode': pgbench_config.mode,
+            'warmup_time': pgbench_config.warmup_time,
+            'load_results': load_results,
+            'downtime_results': ''.join(downtime_results),
+            'downtime_comparison': downtime_comparison,
+            'load_comparison': load_comparison,
+        })
+        
+        # 整份报告编码一次，以二进制方式一次写入，绕过文本层的分块编码和缓冲
+        with open(filename, 'wb') as f:
+            f.write(report.encode('utf-8'))
         
         print(f"✅ 增强版测试报告已保存: {filename}")
         
@@ -427,5 +716,12 @@ class FailoverTester:
         """清理资源"""
         print("\n🧹 清理资源...")
         self.test_running = False
+        self._stop_event.set()
+        self._stop_monitors()
+        if self._monitor_pool is not None:
+            self._monitor_pool.shutdown(wait=True)
+            self._monitor_pool = None
         self.load_generator.stop_load_generation()
+        for error in self.results.get('thread_errors', []):
+            print(f"   ⚠️ 后台线程异常: {error}")
         print("✅ 清理完成")
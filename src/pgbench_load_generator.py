@@ -1,11 +1,33 @@
+import selectors
 import subprocess
 import threading
 import time
 import re
 import os
+import atexit
+import contextlib
+import tempfile
+import socket
+import psycopg2
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 from dataclasses import dataclass
 from typing import Dict, List, Optional
-from queue import Queue
+
+# pgbench 输出解析使用的正则，模块加载时编译一次
+# 进度行格式: progress: 5.0 s, 1234.5 tps, lat 8.123 ms stddev 1.456, 0 failed
+PROGRESS_PATTERN = re.compile(
+    r'progress: ([\d.]+) s, ([\d.]+) tps, lat ([\d.]+) ms stddev ([\d.]+)(?:, lag [\d.]+ ms)?(?:, (\d+) failed)?'
+)
+# 最终结果格式: tps = 1234.567890 (including connections establishing)
+FINAL_TPS_PATTERN = re.compile(r'tps = ([\d.]+)')
+
+
+def _remove_file(path: str):
+    """删除临时文件，文件已不存在时忽略"""
+    with contextlib.suppress(FileNotFoundError):
+        os.unlink(path)
+
 
 @dataclass
 class PgbenchConfig:
@@ -26,6 +48,33 @@ class PgbenchConfig:
     
     # 数据库连接配置
     connections: Dict = None   # {'direct': {...}, 'proxy': {...}}
+    connection_options: Dict = None  # psycopg2.connect 的 TLS 与 keepalive 参数，见 TestConfig.get_connection_options()
+
+@dataclass(slots=True)
+class PgbenchStats:
+    """单个连接类型的 pgbench 指标汇总，每解析一行增量更新"""
+    sample_count: int = 0
+    tps_sum: float = 0.0
+    tps_min: float = float('inf')
+    tps_max: float = 0.0
+    latency_sum: float = 0.0
+    latency_min: float = float('inf')
+    latency_max: float = 0.0
+    error_count: int = 0
+    
+    def record_progress(self, tps: float, latency_ms: float):
+        """计入一条进度报告"""
+        self.sample_count += 1
+        self.tps_sum += tps
+        self.latency_sum += latency_ms
+        if tps < self.tps_min:
+            self.tps_min = tps
+        if tps > self.tps_max:
+            self.tps_max = tps
+        if latency_ms < self.latency_min:
+            self.latency_min = latency_ms
+        if latency_ms > self.latency_max:
+            self.latency_max = latency_ms
 
 class PgbenchLoadGenerator:
     """pgbench 负载生成器"""
@@ -33,46 +82,131 @@ class PgbenchLoadGenerator:
     def __init__(self, config: PgbenchConfig):
         self.config = config
         self.processes = {}  # {conn_type: process}
-        self.metrics_queue = Queue()
         self.running = False
         self.start_time = None
+        # 原始样本只保留覆盖整个测试时长的窗口，汇总值见 self.stats
+        capacity = max(64, (config.duration + config.warmup_time) // max(1, config.progress_interval) + 8)
         self.metrics = {
-            'direct': {'tps': [], 'latency': [], 'errors': []},
-            'proxy': {'tps': [], 'latency': [], 'errors': []}
+            conn_type: {'tps': deque(maxlen=capacity), 'latency': deque(maxlen=capacity), 'errors': [],
+                        'final_tps': None}
+            for conn_type in ('direct', 'proxy')
+        }
+        # 汇总值由解析线程更新、报告线程读取，读写都在锁内进行
+        self.stats = {conn_type: PgbenchStats() for conn_type in self.metrics}
+        self._stats_lock = threading.Lock()
+        self._reader_thread = None
+        
+        # 每种连接的公共参数只拼装一次
+        self._base_cmd = {
+            conn_type: ['-h', conn_config['host'], '-p', str(conn_config['port']),
+                        '-U', conn_config['user'], '-d', conn_config['database']]
+            for conn_type, conn_config in config.connections.items()
         }
+        self._env = self._build_env(config.connections)
+        self._connection_options = config.connection_options or {}
+    
+    @staticmethod
+    def _build_env(connections: Dict) -> Dict:
+        """
+        构建所有 pgbench 子进程共用的环境变量
+        
+        密码写入仅当前用户可读的临时 PGPASSFILE，不出现在子进程的环境变量中，
+        文件在进程退出时删除。
+        """
+        env = os.environ.copy()
+        entries = []
+        for conn_config in connections.values():
+            if 'password' not in conn_config:
+                continue
+            # .pgpass 格式 host:port:database:user:password，字段中的 \ 和 : 需要转义
+            fields = (conn_config[field] for field in ('host', 'port', 'database', 'user', 'password'))
+            entries.append(':'.join(str(value).replace('\\', '\\\\').replace(':', '\\:') for value in fields))
+        
+        if entries:
+            fd, path = tempfile.mkstemp(prefix='pgbench_', suffix='.pgpass')  # 权限 0600
+            with os.fdopen(fd, 'w') as f:
+                f.write('\n'.join(entries) + '\n')
+            atexit.register(_remove_file, path)
+            env['PGPASSFILE'] = path
+        return env
     
     def prepare_database(self):
         """准备 pgbench 测试数据"""
         print("🔧 准备 pgbench 测试数据...")
         
+        # 指向同一个数据库的连接（例如 direct 和 proxy 背后的同一个写实例）只需初始化一次
+        targets = {}
         for conn_type, conn_config in self.config.connections.items():
-            print(f"   初始化 {conn_type} 连接的测试数据...")
-            
-            cmd = [
-                'pgbench',
-                '-i',  # 初始化模式
-                '-s', str(self.config.scale_factor),
-                '-h', conn_config['host'],
-                '-p', str(conn_config['port']),
-                '-U', conn_config['user'],
-                '-d', conn_config['database']
-            ]
-            
-            # 设置环境变量（如果需要密码）
-            env = os.environ.copy()
-            if 'password' in conn_config:
-                env['PGPASSWORD'] = conn_config['password']
-            
+            key = self._resolve_target(conn_config)
+            if key in targets:
+                print(f"   ↪ {conn_type} 与 {targets[key][0]} 指向同一数据库，复用其初始化数据")
+                continue
+            targets[key] = (conn_type, conn_config)
+        
+        # 不同数据库的初始化并行执行
+        with ThreadPoolExecutor(max_workers=len(targets) or 1) as executor:
+            futures = [executor.submit(self._init_database, conn_type, conn_config)
+                       for conn_type, conn_config in targets.values()]
+            for future in futures:
+                future.result()
+    
+    def _resolve_target(self, conn_config: Dict) -> tuple:
+        """
+        确定连接实际落到的数据库实例
+        
+        优先查询服务端地址，经 RDS Proxy 的连接也能得到背后写实例的地址；
+        查询失败或通过 Unix socket 连接时退回到解析后的主机地址。
+        """
+        try:
+            conn = psycopg2.connect(
+                host=conn_config['host'],
+                port=conn_config['port'],
+                user=conn_config['user'],
+                password=conn_config.get('password', ''),
+                database=conn_config['database'],
+                connect_timeout=5,
+                **self._connection_options
+            )
             try:
-                result = subprocess.run(cmd, capture_output=True, text=True, timeout=300, env=env)
-                if result.returncode == 0:
-                    print(f"   ✅ {conn_type} 数据初始化完成")
-                else:
-                    print(f"   ❌ {conn_type} 数据初始化失败: {result.stderr}")
-                    raise Exception(f"数据初始化失败: {result.stderr}")
-            except subprocess.TimeoutExpired:
-                print(f"   ⏰ {conn_type} 数据初始化超时")
-                raise Exception("数据初始化超时")
+                with conn.cursor() as cursor:
+                    cursor.execute("SELECT host(inet_server_addr()), inet_server_port()")
+                    server_addr, server_port = cursor.fetchone()
+            finally:
+                conn.close()
+            if server_addr is not None:
+                return (server_addr, server_port, conn_config['database'])
+        except psycopg2.Error:
+            pass
+        
+        host = conn_config['host']
+        if not host.startswith('/'):
+            try:
+                host = socket.gethostbyname(host)
+            except OSError:
+                pass
+        return (host, conn_config['port'], conn_config['database'])
+    
+    def _init_database(self, conn_type: str, conn_config: Dict):
+        """为单个连接执行 pgbench -i"""
+        print(f"   初始化 {conn_type} 连接的测试数据...")
+        
+        cmd = [
+            'pgbench',
+            '-i',  # 初始化模式
+            '-s', str(self.config.scale_factor),
+            *self._base_cmd[conn_type]
+        ]
+        
+        try:
+            result = subprocess.run(cmd, capture_output=True, text=True, timeout=300, env=self._env)
+            if result.returncode == 0:
+                print(f"   ✅ {conn_type} 数据初始化完成")
+            else:
+                print(f"   ❌ {conn_type} 数据初始化失败: {result.stderr}")
+                raise Exception(f"数据初始化失败: {result.stderr}")
+        except subprocess.TimeoutExpired:
+            print(f"   ⏰ {conn_type} 数据初始化超时")
+            raise Exception("数据初始化超时")
     
     def start_load_generation(self):
         """启动负载生成"""
@@ -80,18 +214,23 @@ class PgbenchLoadGenerator:
         self.running = True
         self.start_time = time.time()
         
-        # 为每种连接类型启动 pgbench 进程
+        # 为每种连接类型启动 pgbench 进程，所有输出管道注册到同一个 selector
+        selector = selectors.DefaultSelector()
         for conn_type, conn_config in self.config.connections.items():
             process = self._start_pgbench_process(conn_type, conn_config)
             self.processes[conn_type] = process
             
-            # 启动输出解析线程
-            parser_thread = threading.Thread(
-                target=self._parse_pgbench_output,
-                args=(process, conn_type)
-            )
-            parser_thread.daemon = True
-            parser_thread.start()
+            fd = process.stdout.fileno()
+            os.set_blocking(fd, False)
+            selector.register(fd, selectors.EVENT_READ, conn_type)
+        
+        # 单个后台线程读取并解析全部 pgbench 输出
+        self._reader_thread = threading.Thread(
+            target=self._parse_pgbench_output,
+            args=(selector,)
+        )
+        self._reader_thread.daemon = True
+        self._reader_thread.start()
         
         print(f"✅ 已启动 {len(self.processes)} 个 pgbench 进程")
     
@@ -103,10 +242,8 @@ class PgbenchLoadGenerator:
             '-j', str(self.config.jobs),
             '-T', str(self.config.duration),
             '-P', str(self.config.progress_interval),
-            '-h', conn_config['host'],
-            '-p', str(conn_config['port']),
-            '-U', conn_config['user'],
-            '-d', conn_config['database']
+            '--progress-timestamp',  # 进度行以 Unix 时间戳代替已运行秒数
+            *self._base_cmd[conn_type]
         ]
         
         # 根据模式添加参数
@@ -115,74 +252,104 @@ class PgbenchLoadGenerator:
         elif self.config.mode == "custom" and self.config.custom_script:
             cmd.extend(['-f', self.config.custom_script])
         
-        # 设置环境变量（如果需要密码）
-        env = os.environ.copy()
-        if 'password' in conn_config:
-            env['PGPASSWORD'] = conn_config['password']
-        
         print(f"   启动 {conn_type} pgbench: {' '.join(cmd[:8])}...")  # 只显示前几个参数
         
         return subprocess.Popen(
             cmd,
             stdout=subprocess.PIPE,
             stderr=subprocess.STDOUT,  # 将 stderr 重定向到 stdout
-            text=True,
-            env=env
+            bufsize=0,  # 输出直接用 os.read 读取并按 UTF-8 解码，不需要 Python 侧的缓冲和文本包装
+            env=self._env
         )
     
-    def _parse_pgbench_output(self, process, conn_type: str):
-        """解析 pgbench 输出"""
-        while self.running and process.poll() is None:
-            line = process.stdout.readline()
-            if not line:
-                continue
-                
-            line = line.strip()
-            
-            # 解析进度报告
-            # 格式: progress: 5.0 s, 1234.5 tps, lat 8.123 ms stddev 1.456, 0 failed
-            if line.startswith('progress:'):
-                metrics = self._parse_progress_line(line)
-                if metrics:
-                    metrics['conn_type'] = conn_type
-                    metrics['timestamp'] = time.time()
-                    self.metrics_queue.put(metrics)
+    def _parse_pgbench_output(self, selector):
+        """读取所有 pgbench 进程的输出，按行分发解析"""
+        buffers = {key.data: b'' for key in selector.get_map().values()}
+        try:
+            while self.running and selector.get_map():
+                events = selector.select(timeout=0.5)
+                # 同一次唤醒读到的所有行共用一个时间戳
+                now = time.time()
+                for key, _ in events:
+                    conn_type = key.data
+                    try:
+                        chunk = os.read(key.fd, 65536)
+                    except BlockingIOError:
+                        continue
                     
-                    # 存储到内存中用于分析
-                    self.metrics[conn_type]['tps'].append(metrics['tps'])
-                    self.metrics[conn_type]['latency'].append(metrics['latency_ms'])
-            
-            # 解析错误信息
-            elif 'ERROR' in line or 'FATAL' in line:
-                error_info = {
-                    'type': 'error',
-                    'conn_type': conn_type,
-                    'message': line,
-                    'timestamp': time.time()
-                }
-                self.metrics_queue.put(error_info)
-                self.metrics[conn_type]['errors'].append(error_info)
+                    if not chunk:
+                        # 进程已退出，处理最后一行不完整的输出
+                        selector.unregister(key.fd)
+                        tail = buffers.pop(conn_type)
+                        if tail:
+                            self._handle_output_line(tail, conn_type, now)
+                        continue
+                    
+                    *lines, buffers[conn_type] = (buffers[conn_type] + chunk).split(b'\n')
+                    for line in lines:
+                        self._handle_output_line(line, conn_type, now)
+        finally:
+            selector.close()
+    
+    def _handle_output_line(self, raw_line: bytes, conn_type: str, now: float):
+        """解析 pgbench 输出的一行"""
+        line = raw_line.decode('utf-8', errors='replace').strip()
+        
+        # 解析进度报告
+        # 格式: progress: 5.0 s, 1234.5 tps, lat 8.123 ms stddev 1.456, 0 failed
+        if line.startswith('progress:'):
+            metrics = self._parse_progress_line(line)
+            if metrics:
+                # 存储到内存中用于分析
+                self.metrics[conn_type]['tps'].append(metrics['tps'])
+                self.metrics[conn_type]['latency'].append(metrics['latency_ms'])
+                with self._stats_lock:
+                    self.stats[conn_type].record_progress(metrics['tps'], metrics['latency_ms'])
         
         # 解析最终结果
-        if process.poll() is not None:
-            # 读取剩余的输出
-            remaining_output = process.stdout.read()
-            if remaining_output:
-                self._parse_final_results(remaining_output, conn_type)
+        elif line.startswith('tps = '):
+            self._parse_final_results(line, conn_type)
+        
+        # 解析错误信息
+        elif 'ERROR' in line or 'FATAL' in line:
+            error_info = {
+                'type': 'error',
+                'conn_type': conn_type,
+                'message': line,
+                'timestamp': now
+            }
+            self.metrics[conn_type]['errors'].append(error_info)
+            with self._stats_lock:
+                self.stats[conn_type].error_count += 1
     
     def _parse_progress_line(self, line: str) -> Optional[Dict]:
         """解析进度行"""
         try:
-            # 使用正则表达式解析
-            # progress: 5.0 s, 1234.5 tps, lat 8.123 ms stddev 1.456, 0 failed
-            pattern = r'progress: ([\d.]+) s, ([\d.]+) tps, lat ([\d.]+) ms stddev ([\d.]+)(?:, (\d+) failed)?'
-            match = re.search(pattern, line)
+            # 常见格式按空白切分后字段位置固定，直接取值，无需正则：
+            # progress: <ts> s, <tps> tps, lat <lat> ms stddev <sd>[, <n> failed]
+            # 只接受恰好 10 个字段，或 12 个字段且以 failed 结尾的行
+            tokens = line.split()
+            if (len(tokens) in (10, 12) and tokens[2] == 's,' and tokens[4] == 'tps,'
+                    and tokens[5] == 'lat' and tokens[8] == 'stddev'
+                    and (len(tokens) == 10 or tokens[11] == 'failed')):
+                failed = len(tokens) == 12
+                return {
+                    'type': 'progress',
+                    'progress_timestamp': float(tokens[1]),
+                    'tps': float(tokens[3]),
+                    'latency_ms': float(tokens[6]),
+                    'latency_stddev': float(tokens[9].rstrip(',')),
+                    'failed_count': int(tokens[10]) if failed else 0
+                }
+            
+            # 其他格式（例如带 lag 字段）回退到正则，从行首匹配即可
+            match = PROGRESS_PATTERN.match(line)
             
             if match:
                 failed_count = int(match.group(5)) if match.group(5) else 0
                 return {
                     'type': 'progress',
-                    'elapsed_time': float(match.group(1)),
+                    'progress_timestamp': float(match.group(1)),
                     'tps': float(match.group(2)),
                     'latency_ms': float(match.group(3)),
                     'latency_stddev': float(match.group(4)),
@@ -197,19 +364,10 @@ class PgbenchLoadGenerator:
         """解析最终结果"""
         try:
             # 查找最终的 tps 结果行
-            # 格式: tps = 1234.567890 (including connections establishing)
-            tps_pattern = r'tps = ([\d.]+)'
-            tps_match = re.search(tps_pattern, output)
+            tps_match = FINAL_TPS_PATTERN.search(output)
             
             if tps_match:
-                final_tps = float(tps_match.group(1))
-                final_result = {
-                    'type': 'final',
-                    'conn_type': conn_type,
-                    'final_tps': final_tps,
-                    'timestamp': time.time()
-                }
-                self.metrics_queue.put(final_result)
+                self.metrics[conn_type]['final_tps'] = float(tps_match.group(1))
         except Exception as e:
             print(f"解析最终结果失败: {e}")
     
@@ -227,35 +385,40 @@ class PgbenchLoadGenerator:
                 except subprocess.TimeoutExpired:
                     process.kill()
                     print(f"   ⚠️ {conn_type} pgbench 进程被强制终止")
+        
+        if self._reader_thread is not None:
+            self._reader_thread.join(timeout=2)
     
     def get_current_metrics(self) -> Dict:
         """获取当前性能指标"""
         current_metrics = {}
         
         for conn_type in self.config.connections.keys():
-            metrics = self.metrics[conn_type]
-            if metrics['tps']:
-                current_metrics[conn_type] = {
-                    'avg_tps': sum(metrics['tps']) / len(metrics['tps']),
-                    'max_tps': max(metrics['tps']),
-                    'min_tps': min(metrics['tps']),
-                    'avg_latency_ms': sum(metrics['latency']) / len(metrics['latency']),
-                    'max_latency_ms': max(metrics['latency']),
-                    'min_latency_ms': min(metrics['latency']),
-                    'error_count': len(metrics['errors']),
-                    'sample_count': len(metrics['tps'])
-                }
-            else:
-                current_metrics[conn_type] = {
-                    'avg_tps': 0,
-                    'max_tps': 0,
-                    'min_tps': 0,
-                    'avg_latency_ms': 0,
-                    'max_latency_ms': 0,
-                    'min_latency_ms': 0,
-                    'error_count': 0,
-                    'sample_count': 0
-                }
+            with self._stats_lock:
+                stats = self.stats[conn_type]
+                count = stats.sample_count
+                if count:
+                    current_metrics[conn_type] = {
+                        'avg_tps': stats.tps_sum / count,
+                        'max_tps': stats.tps_max,
+                        'min_tps': stats.tps_min,
+                        'avg_latency_ms': stats.latency_sum / count,
+                        'max_latency_ms': stats.latency_max,
+                        'min_latency_ms': stats.latency_min,
+                        'error_count': stats.error_count,
+                        'sample_count': count
+                    }
+                else:
+                    current_metrics[conn_type] = {
+                        'avg_tps': 0,
+                        'max_tps': 0,
+                        'min_tps': 0,
+                        'avg_latency_ms': 0,
+                        'max_latency_ms': 0,
+                        'min_latency_ms': 0,
+                        'error_count': 0,
+                        'sample_count': 0
+                    }
         
         return current_metrics
     
@@ -263,7 +426,6 @@ class PgbenchLoadGenerator:
         """获取详细的性能指标数据"""
         return {
             'raw_metrics': self.metrics,
-            'queue_size': self.metrics_queue.qsize(),
             'running': self.running,
             'start_time': self.start_time,
             'processes_status': {
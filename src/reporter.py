@@ -3,10 +3,31 @@
 """
 
 import json
+import math
 import os
-from datetime import datetime
+from datetime import datetime, timezone
 from typing import Dict, Any, Optional
-from .connection_tester import TestResult
+from .connection_tester import LATENCY_BUCKETS, OPERATION_TYPES, BusinessOperation, TestResult
+
+try:
+    import orjson  # 可选依赖：安装后用于加快结果 JSON 的序列化
+except ImportError:
+    orjson = None
+
+# 对比报告“基本统计信息”表：(标签, TestResult 属性, 数值格式)，差异为 代理 - 直接
+COMPARISON_METRICS = (
+    ('总操作数', 'total_attempts', ''),
+    ('成功操作', 'successful_attempts', ''),
+    ('失败操作', 'failed_attempts', ''),
+    ('总体成功率(%)', 'success_rate', '.2f'),
+)
+
+# 对比报告“按操作类型统计”表：(标签, 操作数属性, 成功率属性)
+OPERATION_TYPE_METRICS = (
+    ('读操作', 'read_operations', 'read_success_rate'),
+    ('写操作', 'write_operations', 'write_success_rate'),
+    ('事务操作', 'transaction_operations', 'transaction_success_rate'),
+)
 
 
 class Reporter:
@@ -19,11 +40,49 @@ class Reporter:
     
     def _ensure_results_dir(self):
         """确保结果目录存在"""
-        if not os.path.exists(self.results_dir):
-            os.makedirs(self.results_dir)
+        os.makedirs(self.results_dir, exist_ok=True)
+    
+    @staticmethod
+    def _operation_to_dict(op) -> Dict[str, Any]:
+        """将业务操作记录转换为可序列化的字典，时间精确到毫秒"""
+        return {
+            'operation_id': op.operation_id,
+            'operation_type': op.operation_type,
+            'start_time': op.start_time.isoformat(timespec='milliseconds'),
+            'end_time': op.end_time.isoformat(timespec='milliseconds') if op.end_time else None,
+            'success': op.success,
+            'error_message': op.error_message,
+            'response_time': op.response_time,
+            'affected_rows': op.affected_rows
+        }
+    
+    @classmethod
+    def _json_default(cls, obj):
+        """序列化器无法直接处理的对象在编码时转换"""
+        if isinstance(obj, BusinessOperation):
+            return cls._operation_to_dict(obj)
+        if isinstance(obj, datetime):
+            return obj.isoformat()
+        raise TypeError(f"无法序列化的类型: {type(obj).__name__}")
     
-    def save_result(self, test_type: str, result: TestResult):
-        """保存测试结果"""
+    @classmethod
+    def _make_encoder(cls, indent: bool):
+        """返回将对象编码为 UTF-8 JSON 字节的函数，安装了 orjson 时优先使用"""
+        if orjson is not None:
+            option = orjson.OPT_PASSTHROUGH_DATACLASS | (orjson.OPT_INDENT_2 if indent else 0)
+            return lambda obj: orjson.dumps(obj, default=cls._json_default, option=option)
+        if indent:
+            encoder = json.JSONEncoder(default=cls._json_default, ensure_ascii=False, indent=2)
+        else:
+            encoder = json.JSONEncoder(default=cls._json_default, ensure_ascii=False, separators=(',', ':'))
+        return lambda obj: encoder.encode(obj).encode('utf-8')
+    
+    def save_result(self, test_type: str, result: TestResult, pretty: bool = False):
+        """
+        保存测试结果
+        
+        默认写出紧凑 JSON；pretty=True 时按 2 空格缩进，operations 数组每行一条操作。
+        """
         self.results[test_type] = result
         
         # 保存详细结果到JSON文件
@@ -39,14 +98,9 @@ class Reporter:
             'failed_attempts': result.failed_attempts,
             'success_rate': result.success_rate,
             'total_downtime': result.total_downtime,
-            'downtime_periods': [
-                {
-                    'start': period['start'].isoformat(),
-                    'end': period['end'].isoformat(),
-                    'duration': period['duration']
-                }
-                for period in result.downtime_periods
-            ],
+            'reconnect_attempts': result.reconnect_attempts,
+            'lost_write_rows': result.lost_write_rows,
+            'downtime_periods': result.downtime_periods,
             # 业务操作统计
             'read_operations': result.read_operations,
             'write_operations': result.write_operations,
@@ -58,27 +112,85 @@ class Reporter:
             'write_success_rate': result.write_success_rate,
             'transaction_success_rate': result.transaction_success_rate,
             'average_response_time': result.average_response_time,
-            # 详细操作记录
-            'operations': [
-                {
-                    'operation_id': op.operation_id,
-                    'operation_type': op.operation_type,
-                    'start_time': op.start_time.isoformat(),
-                    'end_time': op.end_time.isoformat() if op.end_time else None,
-                    'success': op.success,
-                    'error_message': op.error_message,
-                    'response_time': op.response_time,
-                    'affected_rows': op.affected_rows
+            'latency_percentiles': {
+                'p50': result.percentile(50),
+                'p95': result.percentile(95),
+                'p99': result.percentile(99)
+            },
+            'latency_buckets': {
+                'upper_bounds': list(LATENCY_BUCKETS),
+                'counts': result.bucket_counts
+            },
+            'latency_by_type': {
+                operation_type: {
+                    'count': stats.count,
+                    'mean': stats.mean,
+                    'min': stats.min if stats.count else None,
+                    'max': stats.max
                 }
-                for op in result.operations
-            ]
+                for operation_type, stats in result.latency_by_type.items()
+            },
+            # 失败/恢复操作的完整信息
+            'critical_operations': result.critical_operations
         }
         
-        with open(filename, 'w', encoding='utf-8') as f:
-            json.dump(result_data, f, indent=2, ensure_ascii=False)
+        # 详细操作记录：全部操作的摘要，逐条生成，不在内存中构建完整列表
+        operations = (
+            {
+                'operation_id': operation_id,
+                'operation_type': OPERATION_TYPES[type_id],
+                'start_time': datetime.fromtimestamp(start_ts, timezone.utc).isoformat(timespec='milliseconds'),
+                'success': bool(success),
+                'response_time': None if math.isnan(response_time) else response_time
+            }
+            for operation_id, type_id, start_ts, response_time, success in zip(
+                result.op_ids, result.op_types, result.op_starts,
+                result.op_response_times, result.op_success
+            )
+        )
+        
+        # 停机区间和关键操作直接交给序列化器，由 _json_default 在编码时转换
+        header = self._make_encoder(indent=pretty)(result_data)
+        encode_operation = self._make_encoder(indent=False)
+        
+        # 去掉头部对象末尾的 "}"，接上逐条写出的 operations 数组
+        if pretty:
+            head, first_prefix, prefix, tail = header[:-2] + b',\n  "operations": [', b'\n    ', b',\n    ', b'\n  ]\n}'
+        else:
+            head, first_prefix, prefix, tail = header[:-1] + b',"operations":[', b'', b',', b']}'
+        
+        # 小块写入由 1MB 缓冲合并
+        with open(filename, 'wb', buffering=1 << 20) as f:
+            f.write(head)
+            item_prefix = first_prefix
+            empty = True
+            for operation in operations:
+                f.write(item_prefix)
+                f.write(encode_operation(operation))
+                item_prefix = prefix
+                empty = False
+            f.write(tail.lstrip() if empty else tail)
         
         print(f"详细结果已保存到: {filename}")
     
+    @staticmethod
+    def _format_metric_rows(rows) -> str:
+        """按 (标签, 直接连接值, 代理连接值, 差异, 数值格式) 渲染对比表的数据行"""
+        return ''.join(
+            f"{label:<20} {direct_value:<15{spec}} {proxy_value:<15{spec}} {diff:<15{spec}}\n"
+            for label, direct_value, proxy_value, diff, spec in rows
+        )
+    
+    @staticmethod
+    def _format_downtime_periods(periods) -> str:
+        """将停机区间渲染为一整段文本"""
+        if not periods:
+            return "  无停机记录\n"
+        return ''.join(
+            f"  {i}. {period['start'].strftime('%H:%M:%S')} - {period['end'].strftime('%H:%M:%S')} (持续 {period['duration']:.3f}秒)\n"
+            for i, period in enumerate(periods, 1)
+        )
+    
     def generate_comparison_report(self):
         """生成对比报告"""
         if 'direct' not in self.results or 'proxy' not in self.results:
@@ -88,131 +200,152 @@ class Reporter:
         direct_result = self.results['direct']
         proxy_result = self.results['proxy']
         
-        # 生成对比报告
-        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+        # 文件报告和控制台摘要共用的指标与对比值只计算一次
+        direct_downtime = direct_result.total_downtime
+        proxy_downtime = proxy_result.total_downtime
+        direct_response_time = direct_result.average_response_time
+        proxy_response_time = proxy_result.average_response_time
+        direct_periods = direct_result.downtime_periods
+        proxy_periods = proxy_result.downtime_periods
+        
+        success_rate_improvement = proxy_result.success_rate - direct_result.success_rate
+        downtime_improvement = None
+        if direct_downtime > 0:
+            downtime_improvement = ((direct_downtime - proxy_downtime) / direct_downtime) * 100
+        response_time_change = None
+        if proxy_response_time > 0 and direct_response_time > 0:
+            response_time_change = ((proxy_response_time - direct_response_time) / direct_response_time) * 100
+        
+        # 生成对比报告，文件名和报告生成时间使用同一时刻
+        now = datetime.now()
+        timestamp = now.strftime("%Y%m%d_%H%M%S")
         report_filename = f"{self.results_dir}/business_comparison_report_{timestamp}.txt"
         
-        with open(report_filename, 'w', encoding='utf-8') as f:
-            f.write("Aurora PostgreSQL 业务场景故障转移测试对比报告\n")
-            f.write("=" * 60 + "\n\n")
-            
-            f.write(f"报告生成时间: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}\n\n")
-            
-            # 测试配置信息
-            f.write("测试配置\n")
-            f.write("-" * 20 + "\n")
-            test_duration = (direct_result.end_time - direct_result.start_time).total_seconds()
-            f.write(f"测试持续时间: {test_duration:.0f}秒\n")
-            f.write(f"测试开始时间: {direct_result.start_time.strftime('%Y-%m-%d %H:%M:%S')}\n")
-            f.write(f"测试结束时间: {direct_result.end_time.strftime('%Y-%m-%d %H:%M:%S')}\n\n")
-            
-            # 基本统计信息
-            f.write("基本统计信息\n")
-            f.write("-" * 20 + "\n")
-            f.write(f"{'指标':<20} {'直接连接':<15} {'代理连接':<15} {'差异':<15}\n")
-            f.write("-" * 70 + "\n")
-            
-            f.write(f"{'总操作数':<20} {direct_result.total_attempts:<15} {proxy_result.total_attempts:<15} {proxy_result.total_attempts - direct_result.total_attempts:<15}\n")
-            f.write(f"{'成功操作':<20} {direct_result.successful_attempts:<15} {proxy_result.successful_attempts:<15} {proxy_result.successful_attempts - direct_result.successful_attempts:<15}\n")
-            f.write(f"{'失败操作':<20} {direct_result.failed_attempts:<15} {proxy_result.failed_attempts:<15} {proxy_result.failed_attempts - direct_result.failed_attempts:<15}\n")
-            f.write(f"{'总体成功率(%)':<20} {direct_result.success_rate:<15.2f} {proxy_result.success_rate:<15.2f} {proxy_result.success_rate - direct_result.success_rate:<15.2f}\n\n")
-            
-            # 按操作类型统计
-            f.write("按操作类型统计\n")
-            f.write("-" * 20 + "\n")
-            f.write(f"{'操作类型':<15} {'直接连接':<25} {'代理连接':<25} {'成功率差异':<15}\n")
-            f.write("-" * 80 + "\n")
-            
-            f.write(f"{'读操作':<15} {direct_result.read_operations}({direct_result.read_success_rate:.1f}%)<{'':<10} {proxy_result.read_operations}({proxy_result.read_success_rate:.1f}%)<{'':<10} {proxy_result.read_success_rate - direct_result.read_success_rate:<15.1f}\n")
-            f.write(f"{'写操作':<15} {direct_result.write_operations}({direct_result.write_success_rate:.1f}%)<{'':<10} {proxy_result.write_operations}({proxy_result.write_success_rate:.1f}%)<{'':<10} {proxy_result.write_success_rate - direct_result.write_success_rate:<15.1f}\n")
-            f.write(f"{'事务操作':<15} {direct_result.transaction_operations}({direct_result.transaction_success_rate:.1f}%)<{'':<10} {proxy_result.transaction_operations}({proxy_result.transaction_success_rate:.1f}%)<{'':<10} {proxy_result.transaction_success_rate - direct_result.transaction_success_rate:<15.1f}\n\n")
-            
-            # 性能指标
-            f.write("性能指标\n")
-            f.write("-" * 20 + "\n")
-            f.write(f"{'指标':<20} {'直接连接':<15} {'代理连接':<15} {'差异':<15}\n")
-            f.write("-" * 70 + "\n")
-            
-            f.write(f"{'平均响应时间(秒)':<20} {direct_result.average_response_time:<15.3f} {proxy_result.average_response_time:<15.3f} {proxy_result.average_response_time - direct_result.average_response_time:<15.3f}\n")
-            f.write(f"{'总停机时间(秒)':<20} {direct_result.total_downtime:<15.3f} {proxy_result.total_downtime:<15.3f} {direct_result.total_downtime - proxy_result.total_downtime:<15.3f}\n")
-            f.write(f"{'停机次数':<20} {len(direct_result.downtime_periods):<15} {len(proxy_result.downtime_periods):<15} {len(direct_result.downtime_periods) - len(proxy_result.downtime_periods):<15}\n\n")
-            
-            # 性能改善分析
-            if direct_result.total_downtime > 0:
-                downtime_improvement = ((direct_result.total_downtime - proxy_result.total_downtime) / direct_result.total_downtime) * 100
-                f.write(f"性能改善分析\n")
-                f.write("-" * 20 + "\n")
-                f.write(f"RDS 代理停机时间减少: {downtime_improvement:.2f}%\n")
-                
-                if proxy_result.average_response_time > 0 and direct_result.average_response_time > 0:
-                    response_time_change = ((proxy_result.average_response_time - direct_result.average_response_time) / direct_result.average_response_time) * 100
-                    f.write(f"RDS 代理响应时间变化: {response_time_change:+.2f}%\n")
-                
-                success_rate_improvement = proxy_result.success_rate - direct_result.success_rate
-                f.write(f"RDS 代理成功率提升: {success_rate_improvement:+.2f}%\n\n")
-                
-                f.write("结论:\n")
-                if downtime_improvement > 5:
-                    f.write("✅ RDS 代理显著减少了故障转移停机时间\n")
-                elif downtime_improvement > 0:
-                    f.write("✅ RDS 代理减少了故障转移停机时间\n")
-                elif downtime_improvement < -5:
-                    f.write("❌ RDS 代理显著增加了故障转移停机时间\n")
-                else:
-                    f.write("➖ RDS 代理对故障转移停机时间影响较小\n")
+        # 报告内容先收集到列表，最后一次写入文件
+        parts = []
+        parts.append("Aurora PostgreSQL 业务场景故障转移测试对比报告\n")
+        parts.append("=" * 60 + "\n\n")
+        
+        parts.append(f"报告生成时间: {now.strftime('%Y-%m-%d %H:%M:%S')}\n\n")
+        
+        # 测试配置信息
+        parts.append("测试配置\n")
+        parts.append("-" * 20 + "\n")
+        test_duration = (direct_result.end_time - direct_result.start_time).total_seconds()
+        parts.append(f"测试持续时间: {test_duration:.0f}秒\n")
+        parts.append(f"测试开始时间: {direct_result.start_time.strftime('%Y-%m-%d %H:%M:%S')}\n")
+        parts.append(f"测试结束时间: {direct_result.end_time.strftime('%Y-%m-%d %H:%M:%S')}\n\n")
+        
+        # 基本统计信息
+        parts.append("基本统计信息\n")
+        parts.append("-" * 20 + "\n")
+        parts.append(f"{'指标':<20} {'直接连接':<15} {'代理连接':<15} {'差异':<15}\n")
+        parts.append("-" * 70 + "\n")
+        
+        parts.append(self._format_metric_rows(
+            (label, getattr(direct_result, attr), getattr(proxy_result, attr),
+             getattr(proxy_result, attr) - getattr(direct_result, attr), spec)
+            for label, attr, spec in COMPARISON_METRICS
+        ))
+        parts.append("\n")
+        
+        # 按操作类型统计
+        parts.append("按操作类型统计\n")
+        parts.append("-" * 20 + "\n")
+        parts.append(f"{'操作类型':<15} {'直接连接':<25} {'代理连接':<25} {'成功率差异':<15}\n")
+        parts.append("-" * 80 + "\n")
+        
+        for label, count_attr, rate_attr in OPERATION_TYPE_METRICS:
+            direct_rate = getattr(direct_result, rate_attr)
+            proxy_rate = getattr(proxy_result, rate_attr)
+            parts.append(f"{label:<15} {getattr(direct_result, count_attr)}({direct_rate:.1f}%)<{'':<10} "
+                         f"{getattr(proxy_result, count_attr)}({proxy_rate:.1f}%)<{'':<10} "
+                         f"{proxy_rate - direct_rate:<15.1f}\n")
+        parts.append("\n")
+        
+        # 性能指标
+        parts.append("性能指标\n")
+        parts.append("-" * 20 + "\n")
+        parts.append(f"{'指标':<20} {'直接连接':<15} {'代理连接':<15} {'差异':<15}\n")
+        parts.append("-" * 70 + "\n")
+        
+        parts.append(self._format_metric_rows((
+            ('平均响应时间(秒)', direct_response_time, proxy_response_time,
+             proxy_response_time - direct_response_time, '.3f'),
+            # 停机相关指标的差异为 直接 - 代理，即代理减少的量
+            ('总停机时间(秒)', direct_downtime, proxy_downtime, direct_downtime - proxy_downtime, '.3f'),
+            ('停机次数', len(direct_periods), len(proxy_periods), len(direct_periods) - len(proxy_periods), ''),
+        )))
+        parts.append("\n")
+        
+        # 性能改善分析
+        if downtime_improvement is not None:
+            parts.append(f"性能改善分析\n")
+            parts.append("-" * 20 + "\n")
+            parts.append(f"RDS 代理停机时间减少: {downtime_improvement:.2f}%\n")
             
-            # 详细停机时间记录
-            f.write(f"\n详细停机时间记录\n")
-            f.write("-" * 30 + "\n")
+            if response_time_change is not None:
+                parts.append(f"RDS 代理响应时间变化: {response_time_change:+.2f}%\n")
             
-            f.write("直接连接停机记录:\n")
-            if direct_result.downtime_periods:
-                for i, period in enumerate(direct_result.downtime_periods, 1):
-                    f.write(f"  {i}. {period['start'].strftime('%H:%M:%S')} - {period['end'].strftime('%H:%M:%S')} (持续 {period['duration']:.3f}秒)\n")
-            else:
-                f.write("  无停机记录\n")
+            parts.append(f"RDS 代理成功率提升: {success_rate_improvement:+.2f}%\n\n")
             
-            f.write("\n代理连接停机记录:\n")
-            if proxy_result.downtime_periods:
-                for i, period in enumerate(proxy_result.downtime_periods, 1):
-                    f.write(f"  {i}. {period['start'].strftime('%H:%M:%S')} - {period['end'].strftime('%H:%M:%S')} (持续 {period['duration']:.3f}秒)\n")
+            parts.append("结论:\n")
+            if downtime_improvement > 5:
+                parts.append("✅ RDS 代理显著减少了故障转移停机时间\n")
+            elif downtime_improvement > 0:
+                parts.append("✅ RDS 代理减少了故障转移停机时间\n")
+            elif downtime_improvement < -5:
+                parts.append("❌ RDS 代理显著增加了故障转移停机时间\n")
             else:
-                f.write("  无停机记录\n")
+                parts.append("➖ RDS 代理对故障转移停机时间影响较小\n")
+        
+        # 详细停机时间记录
+        parts.append(f"\n详细停机时间记录\n")
+        parts.append("-" * 30 + "\n")
+        
+        parts.append("直接连接停机记录:\n")
+        parts.append(self._format_downtime_periods(direct_periods))
+        
+        parts.append("\n代理连接停机记录:\n")
+        parts.append(self._format_downtime_periods(proxy_periods))
+        
+        # 整份报告只编码一次，以二进制方式写入
+        with open(report_filename, 'wb', buffering=1 << 20) as f:
+            f.write(''.join(parts).encode('utf-8'))
         
         print(f"业务场景对比报告已保存到: {report_filename}")
         
-        # 在控制台也显示简要对比
-        print("\n" + "=" * 60)
-        print("业务场景测试结果对比")
-        print("=" * 60)
-        print(f"直接连接:")
-        print(f"  总操作数: {direct_result.total_attempts}")
-        print(f"  总体成功率: {direct_result.success_rate:.2f}%")
-        print(f"  读操作: {direct_result.read_operations} (成功率: {direct_result.read_success_rate:.1f}%)")
-        print(f"  写操作: {direct_result.write_operations} (成功率: {direct_result.write_success_rate:.1f}%)")
-        print(f"  事务操作: {direct_result.transaction_operations} (成功率: {direct_result.transaction_success_rate:.1f}%)")
-        print(f"  平均响应时间: {direct_result.average_response_time:.3f}秒")
-        print(f"  总停机时间: {direct_result.total_downtime:.3f}秒")
-        
-        print(f"\n代理连接:")
-        print(f"  总操作数: {proxy_result.total_attempts}")
-        print(f"  总体成功率: {proxy_result.success_rate:.2f}%")
-        print(f"  读操作: {proxy_result.read_operations} (成功率: {proxy_result.read_success_rate:.1f}%)")
-        print(f"  写操作: {proxy_result.write_operations} (成功率: {proxy_result.write_success_rate:.1f}%)")
-        print(f"  事务操作: {proxy_result.transaction_operations} (成功率: {proxy_result.transaction_success_rate:.1f}%)")
-        print(f"  平均响应时间: {proxy_result.average_response_time:.3f}秒")
-        print(f"  总停机时间: {proxy_result.total_downtime:.3f}秒")
-        
-        print(f"\n性能对比:")
-        if direct_result.total_downtime > 0:
-            downtime_improvement = ((direct_result.total_downtime - proxy_result.total_downtime) / direct_result.total_downtime) * 100
-            print(f"  停机时间减少: {downtime_improvement:.2f}%")
+        # 在控制台也显示简要对比，拼成一段文本一次输出
+        lines = []
+        lines.append("\n" + "=" * 60)
+        lines.append("业务场景测试结果对比")
+        lines.append("=" * 60)
+        lines.append(f"直接连接:")
+        lines.append(f"  总操作数: {direct_result.total_attempts}")
+        lines.append(f"  总体成功率: {direct_result.success_rate:.2f}%")
+        lines.append(f"  读操作: {direct_result.read_operations} (成功率: {direct_result.read_success_rate:.1f}%)")
+        lines.append(f"  写操作: {direct_result.write_operations} (成功率: {direct_result.write_success_rate:.1f}%)")
+        lines.append(f"  事务操作: {direct_result.transaction_operations} (成功率: {direct_result.transaction_success_rate:.1f}%)")
+        lines.append(f"  平均响应时间: {direct_response_time:.3f}秒")
+        lines.append(f"  总停机时间: {direct_downtime:.3f}秒")
         
-        success_rate_improvement = proxy_result.success_rate - direct_result.success_rate
-        print(f"  成功率提升: {success_rate_improvement:+.2f}%")
+        lines.append(f"\n代理连接:")
+        lines.append(f"  总操作数: {proxy_result.total_attempts}")
+        lines.append(f"  总体成功率: {proxy_result.success_rate:.2f}%")
+        lines.append(f"  读操作: {proxy_result.read_operations} (成功率: {proxy_result.read_success_rate:.1f}%)")
+        lines.append(f"  写操作: {proxy_result.write_operations} (成功率: {proxy_result.write_success_rate:.1f}%)")
+        lines.append(f"  事务操作: {proxy_result.transaction_operations} (成功率: {proxy_result.transaction_success_rate:.1f}%)")
+        lines.append(f"  平均响应时间: {proxy_response_time:.3f}秒")
+        lines.append(f"  总停机时间: {proxy_downtime:.3f}秒")
+        
+        lines.append(f"\n性能对比:")
+        if downtime_improvement is not None:
+            lines.append(f"  停机时间减少: {downtime_improvement:.2f}%")
+        
+        lines.append(f"  成功率提升: {success_rate_improvement:+.2f}%")
         
-        if proxy_result.average_response_time > 0 and direct_result.average_response_time > 0:
-            response_time_change = ((proxy_result.average_response_time - direct_result.average_response_time) / direct_result.average_response_time) * 100
-            print(f"  响应时间变化: {response_time_change:+.2f}%")
+        if response_time_change is not None:
+            lines.append(f"  响应时间变化: {response_time_change:+.2f}%")
         
-        print("=" * 60)
+        lines.append("=" * 60)
+        print('\n'.join(lines))
@@ -0,0 +1,115 @@
+"""
+批量写入丢失行计数测试：使用提交时抛出异常的假连接，不需要数据库
+"""
+
+import time
+import unittest
+
+import psycopg2
+
+from src.config import TestConfig
+from src.connection_tester import ConnectionTester
+
+
+class FakeCursor:
+    """只记录连接的假游标，SQL 由被替换的 _write_rows 接收"""
+    rowcount = 0
+
+    def __init__(self, connection):
+        self.connection = connection
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+
+class FakeConnection:
+    """提交时可按需抛出 OperationalError 的假连接"""
+    endpoint_type = 'writer'
+
+    def __init__(self, fail_commit=False):
+        self.closed = 0
+        self.fail_commit = fail_commit
+        self.commits = 0
+        self.rollbacks = 0
+        self.last_used_at = time.monotonic()
+        self.write_buffers = {}
+        self.write_buffered_at = {}
+        self.uncommitted_write_rows = 0
+
+    def cursor(self):
+        return FakeCursor(self)
+
+    def commit(self):
+        if self.fail_commit:
+            raise psycopg2.OperationalError("server closed the connection unexpectedly")
+        self.commits += 1
+
+    def rollback(self):
+        self.rollbacks += 1
+
+    def close(self):
+        self.closed = 1
+
+
+class BatchWriteLossTest(unittest.TestCase):
+
+    def setUp(self):
+        config = TestConfig(duration=1, mode='direct', write_batch_size=3)
+        config.write_batch_max_delay = 60  # 只按行数刷新
+        self.tester = ConnectionTester(config, 'direct')
+        self.written = []
+        self.tester._write_rows = lambda cursor, name, rows: self.written.append((name, list(rows)))
+        self.conn = FakeConnection()
+        self.tester._local.writer = self.conn
+
+    def _buffered_write(self, index):
+        body = lambda cursor, operation: self.tester._buffer_write(
+            cursor, operation, 'logs', (index, 'login', 'details', '10.0.0.1'))
+        return self.tester._run_operation('write', body)
+
+    def test_commit_failure_after_flush_counts_buffered_rows(self):
+        self.assertTrue(self._buffered_write(1).success)
+        self.assertTrue(self._buffered_write(2).success)
+
+        # 第三行触发刷新，刷新成功但提交失败：前两行已计为成功，随回滚丢失
+        self.conn.fail_commit = True
+        operation = self._buffered_write(3)
+
+        self.assertFalse(operation.success)
+        self.assertEqual(len(self.written), 1)
+        self.assertEqual(self.tester.lost_write_rows, 2)
+        self.assertEqual(self.conn.uncommitted_write_rows, 0)
+
+    def test_successful_commit_loses_nothing(self):
+        for i in range(3):
+            self.assertTrue(self._buffered_write(i).success)
+
+        self.assertEqual(len(self.written), 1)
+        self.assertEqual(self.tester.lost_write_rows, 0)
+
+    def test_drain_commit_failure_counts_remaining_rows(self):
+        self.assertTrue(self._buffered_write(1).success)
+        self.assertTrue(self._buffered_write(2).success)
+
+        self.conn.fail_commit = True
+        self.tester._drain_write_buffers(self.conn)
+
+        self.assertEqual(len(self.written), 1)
+        self.assertEqual(self.tester.lost_write_rows, 2)
+        self.assertEqual(self.conn.uncommitted_write_rows, 0)
+        self.assertFalse(any(self.conn.write_buffers.values()))
+
+    def test_drain_flushes_remaining_rows(self):
+        self.assertTrue(self._buffered_write(1).success)
+
+        self.tester._drain_write_buffers(self.conn)
+
+        self.assertEqual(self.written, [('logs', [(1, 'login', 'details', '10.0.0.1')])])
+        self.assertEqual(self.tester.lost_write_rows, 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,41 @@
+"""
+pgbench 进度行解析测试
+"""
+
+import unittest
+
+from src.pgbench_load_generator import PgbenchLoadGenerator
+
+
+class ParseProgressLineTest(unittest.TestCase):
+
+    def setUp(self):
+        # 解析不依赖配置，跳过 __init__ 中的 pgbench 检查
+        self.generator = PgbenchLoadGenerator.__new__(PgbenchLoadGenerator)
+
+    def _failed_count(self, line):
+        return self.generator._parse_progress_line(line)['failed_count']
+
+    def test_plain_line(self):
+        parsed = self.generator._parse_progress_line(
+            'progress: 5.0 s, 812.4 tps, lat 12.301 ms stddev 3.120')
+        self.assertEqual(parsed['tps'], 812.4)
+        self.assertEqual(parsed['latency_stddev'], 3.12)
+        self.assertEqual(parsed['failed_count'], 0)
+
+    def test_failed_count(self):
+        self.assertEqual(self._failed_count(
+            'progress: 5.0 s, 812.4 tps, lat 12.301 ms stddev 3.120, 2 failed'), 2)
+
+    def test_lag_with_failed_count(self):
+        # --rate 时输出 lag 字段，failed 计数不在固定位置
+        self.assertEqual(self._failed_count(
+            'progress: 5.0 s, 812.4 tps, lat 12.301 ms stddev 3.120, lag 0.410 ms, 2 failed'), 2)
+
+    def test_lag_without_failed_count(self):
+        self.assertEqual(self._failed_count(
+            'progress: 5.0 s, 812.4 tps, lat 12.301 ms stddev 3.120, lag 0.410 ms'), 0)
+
+
+if __name__ == '__main__':
+    unittest.main()